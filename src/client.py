@@ -26,6 +26,8 @@ import time
 from configparser import ConfigParser
 from getpass import getpass
 
+from helpers import retrypolicy
+
 
 ############################################################
 #
@@ -50,22 +52,35 @@ class Job:
     self.resultsfilekey = row[5]
 
 
+###################################################################
+#
+# retry policy
+#
+# Shared by web_service_get and web_service_put. API Gateway
+# answers 429 when throttling and 502/503/504 when the Lambda
+# behind it fails or times out; those (and connection errors /
+# timeouts) are retried with backoff, anything else is returned.
+#
+REQUEST_TIMEOUT = 30  # seconds, API Gateway gives up at 29
+
+retry_policy = retrypolicy.RetryPolicy(
+  retry_exceptions=(requests.exceptions.ConnectionError, requests.exceptions.Timeout),
+  breaker=retrypolicy.CircuitBreaker())
+
+
 ###################################################################
 #
 # web_service_get
 #
 # When calling servers on a network, calls can randomly fail. 
-# The better approach is to repeat at least N times (typically 
-# N=3), and then give up after N tries.
+# The better approach is to retry what is worth retrying (with
+# backoff), and to give up once the retry policy says so.
 #
 def web_service_get(url, headers=None):
   """
-  Submits a GET request to a web service at most 3 times, since 
-  web services can fail to respond e.g. to heavy user or internet 
-  traffic. If the web service responds with status code 200, 400 
-  or 500, we consider this a valid response and return the response.
-  Otherwise we try again, at most 3 times. After 3 attempts the 
-  function returns with the last response.
+  Submits a GET request to a web service, retrying throttled /
+  unavailable responses and connection errors according to
+  retry_policy. Any other response is returned immediately.
   
   Parameters
   ----------
@@ -73,36 +88,14 @@ def web_service_get(url, headers=None):
   
   Returns
   -------
-  response received from web service
+  response received from web service, or None on failure
   """
 
   try:
-    retries = 0
-    
-    while True:
-      response = requests.get(url, headers=headers)
-        
-      if response.status_code in [200, 400, 480, 481, 482, 500]:
-        #
-        # we consider this a successful call and response
-        #
-        break;
-
-      #
-      # failed, try again?
-      #
-      retries = retries + 1
-      if retries < 3:
-        # try at most 3 times
-        time.sleep(retries)
-        continue
-          
-      #
-      # if get here, we tried 3 times, we give up:
-      #
-      break
-
-    return response
+    return retry_policy.execute(
+      url,
+      lambda: requests.get(url, headers=headers, timeout=REQUEST_TIMEOUT),
+      lambda response: response.status_code)
 
   except Exception as e:
     print("**ERROR**")
@@ -113,6 +106,9 @@ def web_service_get(url, headers=None):
     
 def web_service_put(url, data):
   """
+  Submits a PUT request to a web service, retrying throttled /
+  unavailable responses and connection errors according to
+  retry_policy. Any other response is returned immediately.
   
   Parameters
   ----------
@@ -121,36 +117,14 @@ def web_service_put(url, data):
   
   Returns
   -------
-  response received from web service
+  response received from web service, or None on failure
   """
 
   try:
-    retries = 0
-    
-    while True:
-      response = requests.put(url, json=data)
-        
-      if response.status_code in [200, 400, 500]:
-        #
-        # we consider this a successful call and response
-        #
-        break;
-
-      #
-      # failed, try again?
-      #
-      retries = retries + 1
-      if retries < 3:
-        # try at most 3 times
-        time.sleep(retries)
-        continue
-          
-      #
-      # if get here, we tried 3 times, we give up:
-      #
-      break
-
-    return response
+    return retry_policy.execute(
+      url,
+      lambda: requests.put(url, json=data, timeout=REQUEST_TIMEOUT),
+      lambda response: response.status_code)
 
   except Exception as e:
     print("**ERROR**")
@@ -184,6 +158,7 @@ def prompt():
       print("   3 => find best fetch")
       print("   4 => add more cards")
       print("   5 => card price")
+      print("   6 => price a list of cards")
 
       cmd = input()
 
@@ -290,7 +265,7 @@ def add_cards(baseurl):
   """
 
   try:
-    query = input("Enter a valid Scryfall search. The first five (or less) new cards will be added to tracking> ")
+    query = input("Enter a valid Scryfall search. Any matching cards not already tracked will be added> ")
 
     query = query.replace(" ", "+")
     #
@@ -392,7 +367,8 @@ def cards(baseurl):
 #
 def prices(baseurl):
   """
-  Returns all price records in the database
+  Returns price records in the database, optionally only those
+  for one card, fetching them a page at a time
 
   Parameters
   ----------
@@ -404,12 +380,94 @@ def prices(baseurl):
   """
 
   try:
+    cardname = input("Enter a card name to only see its prices, or hit enter for all prices> ")
+
     #
     # call the web service:
     #
     api = '/prices'
     url = baseurl + api
 
+    params = {}
+    if cardname != "":
+      params["cardname"] = cardname.replace(' ', '+')
+
+    # the records come back a page at a time; "next" is the cursor
+    # for the following page, or null on the last one:
+    while True:
+      url = baseurl + api
+      if len(params) > 0:
+        url += "?" + "&".join(f"{k}={v}" for k, v in params.items())
+
+      # res = requests.get(url)
+      res = web_service_get(url)
+
+      #
+      # let's look at what we got back:
+      #
+      if res.status_code == 200: #success
+        pass
+      else:
+        # failed:
+        print("**ERROR: failed with status code:", res.status_code)
+        print("url: " + url)
+        if res.status_code == 500:
+          # we'll have an error message
+          body = res.json()
+          print("Error message:", body)
+        #
+        return
+
+      # if it's successful, we have a page of prices
+      body = res.json()
+
+      for price in body["prices"]:
+        print(f"   {price["priceid"]}: {price["name"].replace('+', ' ')}'s {price["set"]} printing was ${price["price"]} on {price["date"]}")
+
+      if body["next"] is None:
+        break
+
+      params["after"] = body["next"]
+    
+    return
+
+  except Exception as e:
+    logging.error("**ERROR: prices() failed:")
+    logging.error("url: " + url)
+    logging.error(e)
+    return
+  
+############################################################
+#
+# get_price
+#
+def get_price(baseurl, cardname):
+  """
+  Return a price record for a specific card
+
+  Parameters
+  ----------
+  baseurl: baseurl for web service
+  cardname: the name of the card to find the price of
+
+  Returns
+  -------
+  nothing
+  """
+
+  try:
+
+    date = input("Input a target date in YYYY-MM-DD format or hit enter to use the most recent price> ")
+
+    #
+    # call the web service:
+    #
+    api = '/cardprice/'
+    url = baseurl + api + cardname.replace(' ', '+')
+
+    if date != "":
+      url += "?date=" + date
+
     # res = requests.get(url)
     res = web_service_get(url)
 
@@ -429,11 +487,10 @@ def prices(baseurl):
       #
       return
 
-    # if it's successful, we have a list of cards
+    # if it's successful, we have a price
     body = res.json()
 
-    for price in body:
-      print(f"   {price["priceid"]}: {price["name"].replace('+', ' ')}'s {price["set"]} printing was ${price["price"]} on {price["date"]}")
+    print(f"Price: ${body["price"]} (as of {body["date"]})")
     
     return
 
@@ -445,16 +502,15 @@ def prices(baseurl):
   
 ############################################################
 #
-# get_price
+# get_prices
 #
-def get_price(baseurl, cardname):
+def get_prices(baseurl):
   """
-  Return a price record for a specific card
+  Prices a list of cards (e.g. a decklist) with one request
 
   Parameters
   ----------
   baseurl: baseurl for web service
-  cardname: the name of the card to find the price of
 
   Returns
   -------
@@ -462,20 +518,25 @@ def get_price(baseurl, cardname):
   """
 
   try:
+    names = input("Enter card names separated by commas> ")
+    date = input("Input a target date in YYYY-MM-DD format or hit enter to use the most recent prices> ")
 
-    date = input("Input a target date in YYYY-MM-DD format or hit enter to use the most recent price> ")
+    cards = [name.strip() for name in names.split(",") if name.strip() != ""]
+
+    data = {"cards": cards}
+    if date != "":
+      data["date"] = date
 
     #
     # call the web service:
     #
-    api = '/cardprice/'
-    url = baseurl + api + cardname.replace(' ', '+')
-
-    if date != "":
-      url += "?date=" + date
+    api = '/cardprices'
+    url = baseurl + api
 
-    # res = requests.get(url)
-    res = web_service_get(url)
+    res = retry_policy.execute(
+      url,
+      lambda: requests.post(url, json=data, timeout=REQUEST_TIMEOUT),
+      lambda response: response.status_code)
 
     #
     # let's look at what we got back:
@@ -493,15 +554,22 @@ def get_price(baseurl, cardname):
       #
       return
 
-    # if it's successful, we have a price
+    # if it's successful, we have a price (or an error) per card
     body = res.json()
 
-    print(f"Price: ${body["price"]}")
-    
+    total = 0
+    for name, result in body["prices"].items():
+      if result["price"] is None:
+        print(f"   {name}: {result["error"]}")
+      else:
+        print(f"   {name}: ${result["price"]} (as of {result["date"]})")
+        total += result["price"]
+
+    print(f"Total: ${total:.2f}")
     return
 
   except Exception as e:
-    logging.error("**ERROR: prices() failed:")
+    logging.error("**ERROR: get_prices() failed:")
     logging.error("url: " + url)
     logging.error(e)
     return
@@ -610,6 +678,8 @@ try:
     elif cmd == 5:
       cardname = input("What card do you want to know the price of?> ")
       get_price(baseurl, cardname)
+    elif cmd == 6:
+      get_prices(baseurl)
 
     else:
       print("** Unknown command, try again...")
@@ -0,0 +1,237 @@
+#
+# analytics.py
+#
+# Price analytics over every tracked card at once. Prices are laid
+# out as a 2D NumPy array, one row per card and one column per day
+# (NaN where a card has no price that day), so each statistic is a
+# handful of whole-array operations instead of a Python loop per
+# card.
+#
+
+import numpy as np
+
+
+###################################################################
+#
+# price_matrix
+#
+# Expects the prices grouped by card (e.g. ORDER BY cardname) and
+# dated by day offset from start (e.g. DATEDIFF(pricedate, start)),
+# so rows come from where the card name changes and columns are the
+# offsets as is, with no per-price conversion of names or dates.
+#
+def price_matrix(names, offsets, prices, start, end):
+  """
+  Builds the aligned cards x days price array
+
+  Parameters
+  ----------
+  names: sequence of card names, one per price, grouped by card,
+  offsets: sequence of ints, one per price, the # of days after
+    start it's for,
+  prices: sequence of floats,
+  start, end: first and last day (datetime.date) of the columns
+
+  Returns
+  -------
+  (cardnames, days, matrix): card names (row labels) in the order
+  they were grouped in, numpy datetime64[D] array of the days
+  (column labels) and the float array, NaN where there is no price
+  """
+  days = np.arange(np.datetime64(start, "D"), np.datetime64(end, "D") + 1)
+
+  names = np.asarray(names, dtype=object)
+  if len(names) == 0:
+    return ([], days, np.full((0, len(days)), np.nan))
+
+  # a new row starts wherever the name differs from the one before:
+  changes = np.empty(len(names), dtype=bool)
+  changes[0] = True
+  np.not_equal(names[1:], names[:-1], out=changes[1:])
+
+  cardnames = names[changes]
+  rows = np.cumsum(changes) - 1
+  cols = np.asarray(offsets, dtype="int64")
+
+  matrix = np.full((len(cardnames), len(days)), np.nan)
+  keep = (cols >= 0) & (cols < len(days))
+  matrix[rows[keep], cols[keep]] = np.asarray(prices, dtype="float64")[keep]
+
+  return (list(cardnames), days, matrix)
+
+
+###################################################################
+#
+# forward_fill
+#
+# Carries each card's last known price forward over missing days
+# (e.g. a day the nightly fetch failed). Days before a card's first
+# price stay NaN.
+#
+def forward_fill(matrix):
+  present = ~np.isnan(matrix)
+  index = np.where(present, np.arange(matrix.shape[1]), 0)
+  np.maximum.accumulate(index, axis=1, out=index)
+  return matrix[np.arange(matrix.shape[0])[:, None], index]
+
+
+###################################################################
+#
+# _rolling_sum
+#
+# Sum and count of the non-NaN values in each trailing window,
+# aligned so column t covers columns t-window+1 .. t.
+#
+def _rolling_sum(matrix, window):
+  present = ~np.isnan(matrix)
+  values = np.where(present, matrix, 0.0)
+
+  zeros = np.zeros((matrix.shape[0], 1))
+  csum = np.concatenate([zeros, np.cumsum(values, axis=1)], axis=1)
+  ccount = np.concatenate([zeros, np.cumsum(present, axis=1)], axis=1)
+
+  sums = np.full(matrix.shape, np.nan)
+  counts = np.zeros(matrix.shape)
+  if window <= matrix.shape[1]:
+    sums[:, window - 1:] = csum[:, window:] - csum[:, :-window]
+    counts[:, window - 1:] = ccount[:, window:] - ccount[:, :-window]
+
+  return (sums, counts)
+
+
+###################################################################
+#
+# sma
+#
+def sma(matrix, window):
+  """
+  Simple moving average over the trailing `window` days; NaN until
+  a card has a full window of prices
+  """
+  sums, counts = _rolling_sum(matrix, window)
+  with np.errstate(invalid="ignore", divide="ignore"):
+    return np.where(counts == window, sums / window, np.nan)
+
+
+###################################################################
+#
+# ema
+#
+def ema(matrix, span):
+  """
+  Exponential moving average with alpha = 2 / (span + 1), seeded
+  with each card's first price; missing days carry the average
+  forward. Steps through the days, but each step updates every
+  card at once.
+  """
+  alpha = 2.0 / (span + 1.0)
+  out = np.full(matrix.shape, np.nan)
+
+  current = np.full(matrix.shape[0], np.nan)
+  for t in range(matrix.shape[1]):
+    x = matrix[:, t]
+    updated = np.where(np.isnan(current), x, alpha * x + (1.0 - alpha) * current)
+    current = np.where(np.isnan(x), current, updated)
+    out[:, t] = current
+
+  return out
+
+
+###################################################################
+#
+# returns
+#
+def returns(matrix):
+  """
+  Daily log returns, aligned with matrix (column 0 is NaN)
+  """
+  out = np.full(matrix.shape, np.nan)
+  with np.errstate(invalid="ignore", divide="ignore"):
+    out[:, 1:] = np.log(matrix[:, 1:] / matrix[:, :-1])
+  out[~np.isfinite(out)] = np.nan
+  return out
+
+
+###################################################################
+#
+# rolling_volatility
+#
+def rolling_volatility(matrix, window):
+  """
+  Sample standard deviation of daily log returns over the trailing
+  `window` returns; NaN until a card has a full window
+  """
+  r = returns(matrix)
+  sums, counts = _rolling_sum(r, window)
+  sq_sums, _ = _rolling_sum(r * r, window)
+
+  with np.errstate(invalid="ignore", divide="ignore"):
+    variance = (sq_sums - sums * sums / window) / (window - 1)
+  variance = np.maximum(variance, 0.0)  # rounding can dip just below 0
+
+  return np.where(counts == window, np.sqrt(variance), np.nan)
+
+
+###################################################################
+#
+# pct_change
+#
+def pct_change(matrix, periods):
+  """
+  Percent change from `periods` days earlier, aligned with matrix
+  """
+  out = np.full(matrix.shape, np.nan)
+  if periods < matrix.shape[1]:
+    with np.errstate(invalid="ignore", divide="ignore"):
+      out[:, periods:] = (matrix[:, periods:] / matrix[:, :-periods] - 1.0) * 100.0
+  out[~np.isfinite(out)] = np.nan
+  return out
+
+
+###################################################################
+#
+# max_drawdown
+#
+def max_drawdown(matrix):
+  """
+  Largest peak-to-trough decline of each card, as a (negative)
+  percent; NaN for a card with no prices
+  """
+  peaks = np.fmax.accumulate(matrix, axis=1)  # fmax skips NaN
+  with np.errstate(invalid="ignore", divide="ignore"):
+    drawdowns = (matrix / peaks - 1.0) * 100.0
+  drawdowns[np.isnan(drawdowns)] = np.inf
+  worst = drawdowns.min(axis=1)
+  return np.where(np.isinf(worst), np.nan, worst)
+
+
+###################################################################
+#
+# summarize
+#
+def summarize(matrix, window, span):
+  """
+  Computes every statistic and returns each card's latest values
+
+  Parameters
+  ----------
+  matrix: cards x days price array (NaN for missing prices),
+  window: trailing window (days) for the SMA, volatility and
+    percent change,
+  span: span (days) of the EMA
+
+  Returns
+  -------
+  dictionary of 1D arrays, one value per card: "price" (latest),
+  "sma", "ema", "volatility", "pct_change" and "max_drawdown"
+  """
+  filled = forward_fill(matrix)
+
+  return {
+    "price": filled[:, -1],
+    "sma": sma(filled, window)[:, -1],
+    "ema": ema(matrix, span)[:, -1],
+    "volatility": rolling_volatility(filled, window)[:, -1],
+    "pct_change": pct_change(filled, window)[:, -1],
+    "max_drawdown": max_drawdown(matrix)
+  }
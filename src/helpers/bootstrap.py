@@ -0,0 +1,256 @@
+#
+# bootstrap.py
+#
+# Shared per-container setup for the lambda handlers. Lambda keeps
+# module state between warm invocations, so the config file is
+# parsed once per container instead of once per request, and AWS
+# clients (and boto3 itself, which is slow to import) are only
+# created the first time a handler actually asks for one.
+#
+# Handlers import this module before their other helpers and wrap
+# lambda_handler with @bootstrap.cold_start_report, which prints a
+# one-line JSON report on a container's first invocation:
+#   {"cold_start": {"handler", "init_ms", "modules_loaded",
+#    "boto3_loaded", "first_invocation_ms"}}
+# init_ms is the time from this module being imported until the
+# first invocation began, i.e. roughly the handler's import cost.
+# For a per-module breakdown, run the handler locally with
+# python -X importtime.
+#
+
+import functools
+import json
+import os
+import sys
+import threading
+import time
+
+from configparser import ConfigParser
+
+
+_imported_at = time.perf_counter()
+_modules_at_import = len(sys.modules)
+
+CONFIG_FILE = 'mtgpricetracker.ini'
+
+_config = None
+_clients = {}  # (kind, service, profile) => boto3 client / resource
+_lock = threading.Lock()
+_cold = True
+
+
+###################################################################
+#
+# config
+#
+def config():
+  """
+  Returns the parsed config file, parsing it on the first call in
+  this container
+
+  Parameters
+  ----------
+  none
+
+  Returns
+  -------
+  a ConfigParser
+  """
+  global _config
+
+  with _lock:
+    if _config is None:
+      configur = ConfigParser()
+      configur.read(CONFIG_FILE)
+      _config = configur
+
+    return _config
+
+
+###################################################################
+#
+# rds_settings
+#
+def rds_settings():
+  """
+  Returns the RDS connection settings from the config file
+
+  Parameters
+  ----------
+  none
+
+  Returns
+  -------
+  (endpoint, portnum, username, pwd, dbname)
+  """
+  configur = config()
+
+  return (configur.get('rds', 'endpoint'),
+          int(configur.get('rds', 'port_number')),
+          configur.get('rds', 'user_name'),
+          configur.get('rds', 'user_pwd'),
+          configur.get('rds', 'db_name'))
+
+
+###################################################################
+#
+# get_dbConn
+#
+def get_dbConn():
+  """
+  Returns a connection to the configured database: RDS, or with
+  backend = sqlite in the [database] section, the SQLite file at
+  sqlite_path. It's a datatier.LazyConnection, so nothing connects
+  (or uses up one of the server's max_connections) until the first
+  query
+  """
+  # imported here, not at the top, so the cold start report's clock
+  # (started when this module loads) includes pymysql's import time
+  import datatier
+
+  configur = config()
+  backend = configur.get('database', 'backend', fallback='mysql')
+
+  if backend == 'sqlite':
+    path = configur.get('database', 'sqlite_path', fallback='mtgpricetracker.db')
+    return datatier.LazyConnection(datatier.get_sqlite_dbConn, path)
+  if backend != 'mysql':
+    raise Exception(f"unknown [database] backend '{backend}', expected mysql or sqlite")
+
+  return datatier.get_lazy_dbConn(*rds_settings())
+
+
+###################################################################
+#
+# configure_scryfall
+#
+def configure_scryfall(cache=True):
+  """
+  Sets up webservice's Scryfall calls from the [scryfall] section
+  of the config file: a response cache for repeated searches (same
+  day reruns, duplicate searches; /tmp survives between warm
+  invocations of this container), the base url (so a local
+  stand-in, src/scryfallstub.py, can be swapped in) and the rate
+  limit (which the stand-in can be sped up past)
+
+  Parameters
+  ----------
+  cache: False to go without the response cache, e.g. for a run
+    that must refetch everything
+
+  Returns
+  -------
+  nothing
+  """
+  # imported here, like datatier above, so handlers that never call
+  # Scryfall don't pay for urllib3
+  import httpcache
+  import webservice
+
+  configur = config()
+
+  cache_ttl = configur.getint('scryfall', 'cache_ttl', fallback=6 * 60 * 60)
+  cache_dir = configur.get('scryfall', 'cache_dir', fallback='/tmp/scryfall-cache')
+  if cache and cache_ttl > 0:
+    webservice.configure_cache(httpcache.ResponseCache(httpcache.DirectoryStore(cache_dir), ttl=cache_ttl))
+  else:
+    webservice.configure_cache(None)  # may be left over from a warm invocation
+
+  webservice.configure_base_url(configur.get('scryfall', 'base_url', fallback=webservice.SCRYFALL_API))
+  webservice.configure_rate_limit(configur.getfloat('scryfall', 'rate_limit', fallback=10.0))
+
+
+###################################################################
+#
+# aws_client / aws_resource
+#
+def _aws(kind, service, profile):
+  key = (kind, service, profile)
+
+  with _lock:
+    if key not in _clients:
+      # the IAM users' access keys live in the config file:
+      os.environ['AWS_SHARED_CREDENTIALS_FILE'] = CONFIG_FILE
+
+      import boto3
+
+      session = boto3.session.Session(profile_name=profile)
+      if kind == "client":
+        _clients[key] = session.client(service)
+      else:
+        _clients[key] = session.resource(service)
+
+    return _clients[key]
+
+
+def aws_client(service, profile='s3readwrite'):
+  """
+  Returns a boto3 client for service (e.g. 's3'), created on first
+  use with the credentials of the given IAM user profile
+  """
+  return _aws("client", service, profile)
+
+
+def aws_resource(service, profile='s3readwrite'):
+  """
+  Returns a boto3 resource for service (e.g. 's3'), created on
+  first use with the credentials of the given IAM user profile
+  """
+  return _aws("resource", service, profile)
+
+
+###################################################################
+#
+# reset
+#
+def reset():
+  """
+  Forgets the parsed config and any AWS clients (for tests, or
+  after editing the config file)
+  """
+  global _config
+
+  with _lock:
+    _config = None
+    _clients.clear()
+
+
+###################################################################
+#
+# cold_start_report
+#
+def cold_start_report(handler):
+  """
+  Wraps a lambda_handler so a container's first invocation prints
+  how long the handler's imports took
+
+  Parameters
+  ----------
+  handler: the lambda_handler(event, context) function
+
+  Returns
+  -------
+  the wrapped handler
+  """
+  @functools.wraps(handler)
+  def wrapper(event, context):
+    global _cold
+
+    if not _cold:
+      return handler(event, context)
+
+    _cold = False
+    start = time.perf_counter()
+    report = {
+      "handler": handler.__module__,
+      "init_ms": round((start - _imported_at) * 1000.0, 3),
+      "modules_loaded": len(sys.modules) - _modules_at_import,
+      "boto3_loaded": "boto3" in sys.modules
+    }
+    try:
+      return handler(event, context)
+    finally:
+      report["first_invocation_ms"] = round((time.perf_counter() - start) * 1000.0, 3)
+      print(json.dumps({"cold_start": report}))
+
+  return wrapper
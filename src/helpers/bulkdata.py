@@ -0,0 +1,201 @@
+#
+# bulkdata.py
+#
+# Reads Scryfall bulk-data files (https://scryfall.com/docs/api/bulk-data),
+# which are one huge JSON array of card objects (hundreds of MB for
+# default_cards). The file is parsed incrementally, one card object
+# at a time, so memory stays bounded by the read buffer and the
+# largest single card rather than the size of the file.
+#
+# Only the standard library json module is used, so there's no
+# extra dependency to add to the Lambda layer.
+#
+
+import codecs
+import gzip
+import json
+
+import cardnames
+import webservice
+
+
+BULK_DATA_PATH = "/bulk-data"
+
+
+###################################################################
+#
+# iter_json_array
+#
+# Yields the elements of a top-level JSON array read from a binary
+# stream, decoding each element as soon as it is complete.
+#
+def iter_json_array(stream, chunk_size=1 << 16):
+  """
+  Incrementally parses a JSON array from a binary stream
+
+  Parameters
+  ----------
+  stream: binary file-like object with read(n),
+  chunk_size: # of bytes read at a time
+
+  Returns
+  -------
+  generator of the array's elements
+  """
+  decoder = json.JSONDecoder()
+  utf8 = codecs.getincrementaldecoder("utf-8")()
+
+  buf = ""
+  pos = 0
+  eof = False
+  started = False
+
+  def refill():
+    nonlocal buf, pos, eof
+    data = stream.read(chunk_size)
+    if not data:
+      eof = True
+      buf = buf[pos:] + utf8.decode(b"", final=True)
+    else:
+      buf = buf[pos:] + utf8.decode(data)
+    pos = 0
+
+  while True:
+    # skip whitespace and separators between elements:
+    while True:
+      while pos < len(buf) and buf[pos] in " \t\r\n,":
+        pos += 1
+      if pos < len(buf) or eof:
+        break
+      refill()
+
+    if pos >= len(buf):
+      raise ValueError("bulk data ended before the closing ]")
+
+    if not started:
+      if buf[pos] != "[":
+        raise ValueError("bulk data is not a JSON array")
+      started = True
+      pos += 1
+      continue
+
+    if buf[pos] == "]":
+      return
+
+    # decode one element, reading more if it isn't all here yet:
+    while True:
+      try:
+        element, end = decoder.raw_decode(buf, pos)
+        break
+      except json.JSONDecodeError:
+        if eof:
+          raise
+        refill()
+
+    pos = end
+    yield element
+
+
+###################################################################
+#
+# default_cards_uri
+#
+def default_cards_uri(bulk_type="default_cards"):
+  """
+  Looks up the current download uri of a Scryfall bulk-data file
+
+  Parameters
+  ----------
+  bulk_type: the bulk-data "type" (default_cards, oracle_cards, ...)
+
+  Returns
+  -------
+  download uri (string)
+  """
+  res = webservice.web_service_get(webservice.scryfall_url(BULK_DATA_PATH))
+  if res is None or res.status != 200:
+    raise Exception(f"Scryfall bulk-data lookup failed with status {None if res is None else res.status}")
+
+  for item in json.loads(res.data)["data"]:
+    if item["type"] == bulk_type:
+      return item["download_uri"]
+
+  raise Exception(f"Scryfall has no bulk-data file of type {bulk_type}")
+
+
+###################################################################
+#
+# open_source
+#
+# Opens a bulk-data file for streaming. source is a local path
+# (optionally .gz) or an http(s) url, which is streamed straight
+# off the socket instead of being downloaded first.
+#
+def open_source(source):
+  """
+  Opens a local path or url as a binary stream
+
+  Parameters
+  ----------
+  source: local file path or http(s) url
+
+  Returns
+  -------
+  binary file-like object; close it when done
+  """
+  if source.startswith("http://") or source.startswith("https://"):
+    res = webservice.get_pool().request('GET', source, preload_content=False, decode_content=True)
+    if res.status != 200:
+      res.release_conn()
+      raise Exception(f"bulk-data download failed with status {res.status}")
+    return res
+
+  if source.endswith(".gz"):
+    return gzip.open(source, "rb")
+
+  return open(source, "rb")
+
+
+###################################################################
+#
+# cheapest_printings
+#
+def cheapest_printings(cards, names):
+  """
+  Finds the cheapest USD paper printing of each tracked card in a
+  single pass over the bulk data
+
+  Parameters
+  ----------
+  cards: iterable of Scryfall card objects,
+  names: set of tracked card names, as stored in the cards table
+    (spaces replaced with +)
+
+  Returns
+  -------
+  dictionary of name => (price, setcode) for every tracked name
+  that had at least one printing with a USD price
+  """
+  best = {}
+
+  for card in cards:
+    name = cardnames.normalize(card.get("name", ""))
+    if name not in names:
+      continue
+
+    # same filters as the search fetch_prices runs:
+    # game:paper -is:memorabilia
+    if "paper" not in card.get("games", []):
+      continue
+    if card.get("set_type") == "memorabilia":
+      continue
+
+    p = card.get("prices", {}).get("usd")
+    if p is None:
+      continue
+    p = float(p)
+
+    if name not in best or p < best[name][0]:
+      best[name] = (p, card["set"])
+
+  return best
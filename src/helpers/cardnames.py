@@ -0,0 +1,40 @@
+#
+# cardnames.py
+#
+# Card names are stored with + in place of spaces (the form they go
+# into Scryfall search urls in), e.g. Arid+Mesa. Every name taken
+# from a request or from Scryfall goes through normalize, so the
+# stored and requested forms match however the caller wrote it.
+#
+
+
+###################################################################
+#
+# normalize
+#
+def normalize(name):
+  """
+  Returns the stored form of a card name
+
+  Parameters
+  ----------
+  name: card name, e.g. " Arid Mesa"
+
+  Returns
+  -------
+  the name with surrounding whitespace removed and spaces replaced
+  by +, e.g. "Arid+Mesa"
+  """
+  return name.strip().replace(" ", "+")
+
+
+###################################################################
+#
+# parse_list
+#
+def parse_list(value):
+  """
+  Returns the stored forms of a comma-separated list of card names
+  (e.g. a ?cards= query string), skipping empty entries
+  """
+  return [normalize(name) for name in value.split(",") if name.strip() != ""]
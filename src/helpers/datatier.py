@@ -3,25 +3,122 @@
 #
 # Executes SQL queries against a MySQL database.
 #
+# Queries are written in MySQL's dialect. For running handlers
+# locally without RDS, get_sqlite_dbConn opens an embedded SQLite
+# database instead (see sqlitebackend.py), which translates them;
+# every other function here works with either kind of connection.
+#
 # Original author:
 #   Prof. Joe Hummel
 #   Northwestern University
 #
 
-import pymysql
+import time
+
+import querystats
+
+try:
+  import pymysql
+except ImportError:  # only needed for the MySQL backend
+  pymysql = None
+
+
+###################################################################
+#
+# connection cache:
+#
+# Lambda keeps the python process (and so module-level state)
+# alive between warm invocations, so we hold on to each open
+# connection here, keyed by (endpoint, portnum, username, dbname),
+# and hand it back out on the next get_dbConn call instead of
+# paying a fresh TCP + auth handshake.
+#
+_dbConns = {}
+
+_conn_stats = {"hits": 0, "misses": 0, "reconnects": 0}
+
+
+###################################################################
+#
+# get_conn_stats:
+#
+# Returns a copy of the connection cache counters.
+#
+def get_conn_stats():
+  """
+  Returns the connection cache counters for this container
+
+  Parameters
+  ----------
+  None
+
+  Returns
+  -------
+  dictionary with "hits" (cached connection reused), "misses"
+  (new connection opened) and "reconnects" (cached connection
+  failed its health check and was replaced)
+  """
+  return dict(_conn_stats)
+
+
+###################################################################
+#
+# close_dbConns:
+#
+# Closes every cached connection and empties the cache.
+#
+def close_dbConns():
+  """
+  Closes and forgets all cached database connections
+
+  Parameters
+  ----------
+  None
+
+  Returns
+  -------
+  nothing
+  """
+  for dbConn in _dbConns.values():
+    try:
+      dbConn.close()
+    except Exception:
+      pass  # already closed / broken, nothing to do
+
+  _dbConns.clear()
+
+
+###################################################################
+#
+# _is_alive:
+#
+# Cheap health check on a cached connection. ping() is a single
+# round trip with no query parsing; the rollback ends any read
+# transaction left open by a previous invocation so we don't keep
+# seeing that invocation's (now stale) InnoDB snapshot.
+#
+def _is_alive(dbConn):
+  try:
+    dbConn.ping(reconnect=False)
+    dbConn.rollback()
+    return True
+  except Exception:
+    return False
 
 
 ###################################################################
 #
 # get_dbConn:
 #
-# Opens and returns a connection object for interacting with a
-# MySQL database.
+# Returns a connection object for interacting with a MySQL
+# database. Connections are cached per container and reused
+# across warm invocations; a cached connection that fails its
+# health check is transparently replaced by a new one.
 #
 def get_dbConn(endpoint, portnum, username, pwd, dbname):
   """
-  Opens and returns a connection object for interacting 
-  with a MySQL database
+  Returns a connection object for interacting with a MySQL 
+  database, reusing a cached connection when one is open
 
   Parameters
   ----------
@@ -35,6 +132,27 @@ def get_dbConn(endpoint, portnum, username, pwd, dbname):
   -------
   a connection object
   """
+  key = (endpoint, portnum, username, dbname)
+  start = time.perf_counter()
+
+  dbConn = _dbConns.get(key)
+  if dbConn is not None:
+    if _is_alive(dbConn):
+      _conn_stats["hits"] += 1
+      querystats.record_connect(time.perf_counter() - start, True)
+      return dbConn
+
+    # stale (server timed us out, RDS failover, ...), replace it:
+    _conn_stats["reconnects"] += 1
+    del _dbConns[key]
+    try:
+      dbConn.close()
+    except Exception:
+      pass
+
+  if pymysql is None:
+    raise ImportError("pymysql is required for the MySQL backend")
+
   try:
     dbConn = pymysql.connect(host=endpoint,
                              port=portnum,
@@ -42,6 +160,9 @@ def get_dbConn(endpoint, portnum, username, pwd, dbname):
                              passwd=pwd,
                              database=dbname)
 
+    _conn_stats["misses"] += 1
+    _dbConns[key] = dbConn
+    querystats.record_connect(time.perf_counter() - start, False)
     return dbConn
 
   except Exception as err:
@@ -50,6 +171,108 @@ def get_dbConn(endpoint, portnum, username, pwd, dbname):
     raise
 
 
+###################################################################
+#
+# get_sqlite_dbConn:
+#
+# Returns a connection to an embedded SQLite database, cached the
+# same way as MySQL connections.
+#
+def get_sqlite_dbConn(path):
+  """
+  Returns a connection object for an SQLite database file,
+  creating the file and schema if needed
+
+  Parameters
+  ----------
+  path : database file (string), or ":memory:"
+
+  Returns
+  -------
+  a connection object
+  """
+  import sqlitebackend
+
+  key = ("sqlite", path)
+  start = time.perf_counter()
+
+  dbConn = _dbConns.get(key)
+  if dbConn is not None:
+    _conn_stats["hits"] += 1
+    querystats.record_connect(time.perf_counter() - start, True)
+    return dbConn
+
+  try:
+    dbConn = sqlitebackend.connect(path)
+
+    _conn_stats["misses"] += 1
+    _dbConns[key] = dbConn
+    querystats.record_connect(time.perf_counter() - start, False)
+    return dbConn
+
+  except Exception as err:
+    print("datatier.get_sqlite_dbConn() failed:")
+    print(str(err))
+    raise
+
+
+###################################################################
+#
+# LazyConnection:
+#
+# Stands in for a connection without opening one. The first time
+# anything asks the proxy for a connection attribute (cursor(),
+# commit(), ...), which every query function below does, it calls
+# connect_fn (get_dbConn or get_sqlite_dbConn) and delegates to
+# the real (cached) connection from then on. Handlers can build one
+# up front and a request that fails validation never touches the
+# database.
+#
+class LazyConnection:
+
+  def __init__(self, connect_fn, *args):
+    self._connect_fn = connect_fn
+    self._args = args
+    self._dbConn = None
+
+  def is_connected(self):
+    return self._dbConn is not None
+
+  def connect(self):
+    if self._dbConn is None:
+      self._dbConn = self._connect_fn(*self._args)
+    return self._dbConn
+
+  def close(self):
+    if self._dbConn is not None:
+      self._dbConn.close()
+      self._dbConn = None
+
+  def __getattr__(self, name):
+    # only called for attributes the proxy itself doesn't have:
+    return getattr(self.connect(), name)
+
+
+###################################################################
+#
+# get_lazy_dbConn:
+#
+def get_lazy_dbConn(endpoint, portnum, username, pwd, dbname):
+  """
+  Returns a connection proxy that doesn't connect to the database
+  until the first query is run against it
+
+  Parameters
+  ----------
+  same as get_dbConn
+
+  Returns
+  -------
+  a LazyConnection, usable anywhere a connection object is
+  """
+  return LazyConnection(get_dbConn, endpoint, portnum, username, pwd, dbname)
+
+
 ##################################################################
 #
 # retrieve_one_row:
@@ -78,16 +301,20 @@ def retrieve_one_row(dbConn, sql, parameters=[]):
   """
 
   dbCursor = dbConn.cursor()
+  start = time.perf_counter()
 
   try:
     dbCursor.execute(sql, parameters)
     row = dbCursor.fetchone()
     if row is None:  # executed successfully, but no data was retrieved
+      querystats.record_query(sql, time.perf_counter() - start, 0)
       return ()
     else:
+      querystats.record_query(sql, time.perf_counter() - start, 1)
       return row
 
   except Exception as err:
+    querystats.record_query(sql, time.perf_counter() - start, None, err)
     print("datatier.retrieve_one_row() failed:")
     print(str(err))
     raise
@@ -125,16 +352,20 @@ def retrieve_all_rows(dbConn, sql, parameters=[]):
   """
 
   dbCursor = dbConn.cursor()
+  start = time.perf_counter()
 
   try:
     dbCursor.execute(sql, parameters)
     rows = dbCursor.fetchall()
     if rows is None:  # executed successfully, but no data was retrieved
+      querystats.record_query(sql, time.perf_counter() - start, 0)
       return []
     else:
+      querystats.record_query(sql, time.perf_counter() - start, len(rows))
       return rows
 
   except Exception as err:
+    querystats.record_query(sql, time.perf_counter() - start, None, err)
     print("datatier.retrieve_all_rows() failed:")
     print(str(err))
     raise
@@ -173,16 +404,19 @@ def perform_action(dbConn, sql, parameters=[]):
   """
 
   dbCursor = dbConn.cursor()
+  start = time.perf_counter()
 
   try:
     # try to execute, and if successful commit the changes
     # and return the # of rows modified by the query:
     dbCursor.execute(sql, parameters)
     dbConn.commit()
+    querystats.record_query(sql, time.perf_counter() - start, dbCursor.rowcount)
     return dbCursor.rowcount
 
   except Exception as err:
     # failed, rollback any possible changes and log error:
+    querystats.record_query(sql, time.perf_counter() - start, None, err)
     dbConn.rollback()
     print("datatier.perform_action() failed:")
     print(str(err))
@@ -190,3 +424,136 @@ def perform_action(dbConn, sql, parameters=[]):
 
   finally:
     dbCursor.close()
+
+
+###############################################################
+#
+# perform_bulk_action:
+#
+# Given a database connection, a parameterized SQL action query
+# and a list of parameter lists, executes the query once per
+# parameter list and returns the total number of rows modified.
+# The rows are sent in chunks of batch_size; each chunk is a
+# single round trip (pymysql rewrites "INSERT ... VALUES (%s, ..)"
+# into one multi-row INSERT, but only if every value in the VALUES
+# list is a %s placeholder, so pass constants as parameters too)
+# and a single transaction / commit.
+# If a chunk fails it is rolled back and the error is raised;
+# chunks committed before the failure stay committed.
+#
+def perform_bulk_action(dbConn, sql, rows, batch_size=500):
+  """
+  Executes an sql ACTION query once per parameter list, in
+  chunks of batch_size with one commit per chunk, and returns
+  the total number of rows modified
+
+  Parameters
+  __________
+  dbConn : the database connection, 
+  sql : the SQL ACTION query (parameterized with %s),
+  rows : list of parameter lists, one per execution,
+  batch_size : max # of parameter lists sent per chunk
+
+  Returns
+  _______
+  total number of rows modified across all chunks
+  """
+
+  if batch_size < 1:
+    raise ValueError("batch_size must be at least 1")
+
+  total = 0
+
+  dbCursor = dbConn.cursor()
+  start = time.perf_counter()
+
+  try:
+    for first in range(0, len(rows), batch_size):
+      chunk = rows[first:first + batch_size]
+      start = time.perf_counter()
+      dbCursor.executemany(sql, chunk)
+      dbConn.commit()
+      querystats.record_query(sql, time.perf_counter() - start, dbCursor.rowcount)
+      total += dbCursor.rowcount
+
+    return total
+
+  except Exception as err:
+    # failed, rollback the current chunk and log error:
+    querystats.record_query(sql, time.perf_counter() - start, None, err)
+    dbConn.rollback()
+    print("datatier.perform_bulk_action() failed:")
+    print(str(err))
+    raise
+
+  finally:
+    dbCursor.close()
+
+
+##################################################################
+#
+# retrieve_row_chunks:
+#
+# Given a database connection and an SQL Select query, executes
+# this query with an unbuffered (server-side) cursor and yields
+# the rows as lists of at most chunk_size tuples, so only one
+# chunk is ever held in memory no matter how large the result
+# set is. The query can be parameterized using %s, in which case
+# pass the values as a list [value1, value2, ...]
+#
+# NOTE: while the generator is live the connection is busy
+# streaming, so don't issue other queries on the same connection
+# until it is exhausted (or closed, which discards the rest).
+#
+def retrieve_row_chunks(dbConn, sql, parameters=[], chunk_size=1000):
+  """
+  Executes an sql SELECT query against the database connection
+  using a server-side cursor and yields the rows in chunks
+
+  Parameters
+  __________
+  dbConn : the database connection, 
+  sql : the SQL SELECT query (can be parameterized with %s),
+  parameters: optional list of values if parameterized,
+  chunk_size: max # of rows per yielded chunk
+
+  Returns
+  _______
+  generator of lists of tuples, each list holding at most
+  chunk_size rows; yields nothing if SELECT retrieves no data
+  """
+
+  if chunk_size < 1:
+    raise ValueError("chunk_size must be at least 1")
+
+  if getattr(dbConn, "backend", "mysql") == "sqlite":
+    dbCursor = dbConn.cursor()  # SQLite cursors stream already
+  else:
+    dbCursor = dbConn.cursor(pymysql.cursors.SSCursor)
+
+  # the time recorded covers the whole stream, including time the
+  # caller spends between chunks, since that is how long the
+  # statement holds the connection:
+  start = time.perf_counter()
+  count = 0
+
+  try:
+    dbCursor.execute(sql, parameters)
+
+    while True:
+      rows = dbCursor.fetchmany(chunk_size)
+      if not rows:
+        break
+      count += len(rows)
+      yield list(rows)
+
+    querystats.record_query(sql, time.perf_counter() - start, count)
+
+  except Exception as err:
+    querystats.record_query(sql, time.perf_counter() - start, count, err)
+    print("datatier.retrieve_row_chunks() failed:")
+    print(str(err))
+    raise
+
+  finally:
+    dbCursor.close()
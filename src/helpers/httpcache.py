@@ -0,0 +1,253 @@
+#
+# httpcache.py
+#
+# Response cache for webservice.web_service_get, keyed by url.
+# Entries are served without a request while younger than ttl;
+# after that, if the server sent an ETag or Last-Modified, the
+# entry is revalidated with a conditional GET (a 304 refreshes it
+# without re-downloading the body). Storage is pluggable:
+# MemoryStore keeps entries in this process, DirectoryStore keeps
+# them as files (e.g. under /tmp, which Lambda keeps between warm
+# invocations of the same container). Both are bounded to
+# max_entries, evicting the least recently used.
+#
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+from collections import OrderedDict
+
+
+###################################################################
+#
+# CachedResponse
+#
+# Stands in for a urllib3 response when a request is served from
+# the cache: has the same .status, .data and .headers.
+#
+class CachedResponse:
+
+  def __init__(self, status, data, headers):
+    self.status = status
+    self.data = data
+    self.headers = headers
+    self.from_cache = True
+
+
+###################################################################
+#
+# CacheEntry
+#
+class CacheEntry:
+
+  def __init__(self, status, data, headers, stored_at):
+    self.status = status
+    self.data = data
+    self.headers = headers      # only the headers worth keeping
+    self.stored_at = stored_at  # time.time() when fetched / revalidated
+
+  def age(self):
+    return time.time() - self.stored_at
+
+  def validators(self):
+    """
+    Returns the conditional request headers for this entry
+    """
+    conditional = {}
+    if "ETag" in self.headers:
+      conditional["If-None-Match"] = self.headers["ETag"]
+    if "Last-Modified" in self.headers:
+      conditional["If-Modified-Since"] = self.headers["Last-Modified"]
+    return conditional
+
+  def response(self):
+    return CachedResponse(self.status, self.data, dict(self.headers))
+
+
+###################################################################
+#
+# MemoryStore
+#
+class MemoryStore:
+
+  def __init__(self, max_entries=1000):
+    self.max_entries = max_entries
+    self.entries = OrderedDict()
+    self.lock = threading.Lock()
+
+  def get(self, key):
+    with self.lock:
+      entry = self.entries.get(key)
+      if entry is not None:
+        self.entries.move_to_end(key)
+      return entry
+
+  def put(self, key, entry):
+    with self.lock:
+      self.entries[key] = entry
+      self.entries.move_to_end(key)
+      while len(self.entries) > self.max_entries:
+        self.entries.popitem(last=False)
+
+  def clear(self):
+    with self.lock:
+      self.entries.clear()
+
+
+###################################################################
+#
+# DirectoryStore
+#
+# One file per url, named by the url's sha256. Each file is a
+# line of JSON metadata followed by the raw body. Files are
+# written to a temp name and renamed into place so a concurrent
+# reader never sees half an entry; a file's mtime is its last use,
+# which is what eviction goes by.
+#
+class DirectoryStore:
+
+  def __init__(self, path, max_entries=5000):
+    self.path = path
+    self.max_entries = max_entries
+    os.makedirs(path, exist_ok=True)
+
+  def _filename(self, key):
+    return os.path.join(self.path, hashlib.sha256(key.encode("utf-8")).hexdigest())
+
+  def get(self, key):
+    filename = self._filename(key)
+    try:
+      with open(filename, "rb") as f:
+        meta = json.loads(f.readline())
+        data = f.read()
+      os.utime(filename)  # mark as recently used
+    except (OSError, ValueError):
+      return None
+
+    if meta.get("url") != key:
+      return None  # hash collision, treat as a miss
+
+    return CacheEntry(meta["status"], data, meta["headers"], meta["stored_at"])
+
+  def put(self, key, entry):
+    filename = self._filename(key)
+    meta = {"url": key, "status": entry.status, "headers": entry.headers, "stored_at": entry.stored_at}
+
+    tmpname = f"{filename}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmpname, "wb") as f:
+      f.write(json.dumps(meta).encode("utf-8"))
+      f.write(b"\n")
+      f.write(entry.data)
+    os.replace(tmpname, filename)
+
+    self._evict()
+
+  def _evict(self):
+    try:
+      names = [n for n in os.listdir(self.path) if not n.endswith(".tmp")]
+    except OSError:
+      return
+
+    if len(names) <= self.max_entries:
+      return
+
+    def last_used(name):
+      try:
+        return os.path.getmtime(os.path.join(self.path, name))
+      except OSError:
+        return 0
+
+    names.sort(key=last_used)
+    for name in names[:len(names) - self.max_entries]:
+      try:
+        os.remove(os.path.join(self.path, name))
+      except OSError:
+        pass  # someone else already evicted it
+
+  def clear(self):
+    for name in os.listdir(self.path):
+      try:
+        os.remove(os.path.join(self.path, name))
+      except OSError:
+        pass
+
+
+###################################################################
+#
+# ResponseCache
+#
+class ResponseCache:
+
+  # response headers kept with an entry:
+  KEEP_HEADERS = ("Content-Type", "ETag", "Last-Modified")
+
+  def __init__(self, store=None, ttl=6 * 60 * 60):
+    """
+    Parameters
+    ----------
+    store: MemoryStore or DirectoryStore (default: MemoryStore()),
+    ttl: seconds an entry is served without revalidating
+    """
+    self.store = MemoryStore() if store is None else store
+    self.ttl = ttl
+    self.stats = {"hits": 0, "stale": 0, "revalidated": 0, "misses": 0, "stores": 0}
+    self.lock = threading.Lock()
+
+  def _count(self, name):
+    with self.lock:
+      self.stats[name] += 1
+
+  def lookup(self, url):
+    """
+    Returns (fresh_response, stale_entry): fresh_response is a
+    CachedResponse to use as is, or None; stale_entry is an
+    expired entry that can be revalidated, or None
+    """
+    entry = self.store.get(url)
+    if entry is None:
+      self._count("misses")
+      return (None, None)
+
+    if entry.age() < self.ttl:
+      self._count("hits")
+      return (entry.response(), None)
+
+    if len(entry.validators()) == 0:
+      self._count("misses")
+      return (None, None)
+
+    self._count("stale")
+    return (None, entry)
+
+  def revalidated(self, url, entry):
+    """
+    Called when a conditional GET for a stale entry got a 304;
+    restarts the entry's ttl and returns its response
+    """
+    self._count("revalidated")
+    entry.stored_at = time.time()
+    self.store.put(url, entry)
+    return entry.response()
+
+  def store_response(self, url, response):
+    """
+    Caches a successful (200) response
+    """
+    if response.status != 200:
+      return
+
+    headers = {}
+    for name in self.KEEP_HEADERS:
+      value = response.headers.get(name)
+      if value is not None:
+        headers[name] = value
+
+    self.store.put(url, CacheEntry(response.status, response.data, headers, time.time()))
+    self._count("stores")
+
+  def get_stats(self):
+    with self.lock:
+      return dict(self.stats)
@@ -0,0 +1,130 @@
+#
+# pricecache.py
+#
+# Small in-process LRU cache of card prices for /cardprice, keyed
+# by (cardname, date) and kept for the life of the Lambda container.
+#
+# Every entry is only trusted for ENTRY_TTL seconds: one that fell
+# back to an earlier day's price (e.g. today's price before the
+# nightly fetch has run) is superseded once a newer price is
+# ingested, and even a price recorded on exactly the requested date
+# can be rewritten, since fetch_prices upserts (a rerun with
+# "force" replaces that day's prices). Every database lookup also
+# reports the newest pricedate in the prices table, and if that is
+# newer than any seen before the whole cache is dropped.
+#
+
+import threading
+import time
+
+from collections import OrderedDict
+
+
+MAX_ENTRIES = 1024
+ENTRY_TTL = 300  # seconds
+
+_entries = OrderedDict()  # (cardname, date) => (price, pricedate, expires)
+_latest = None            # newest pricedate seen, as YYYY-MM-DD
+_stats = {"hits": 0, "misses": 0, "invalidations": 0}
+_lock = threading.Lock()
+
+
+###################################################################
+#
+# get
+#
+def get(cardname, date):
+  """
+  Looks up a cached price
+
+  Parameters
+  ----------
+  cardname: card name, as stored in the cards table,
+  date: requested date (YYYY-MM-DD)
+
+  Returns
+  -------
+  (price, pricedate), or None on a miss
+  """
+  key = (cardname, date)
+
+  with _lock:
+    entry = _entries.get(key)
+    if entry is not None:
+      price, pricedate, expires = entry
+      if expires > time.monotonic():
+        _entries.move_to_end(key)
+        _stats["hits"] += 1
+        return (price, pricedate)
+      del _entries[key]
+
+    _stats["misses"] += 1
+    return None
+
+
+###################################################################
+#
+# note_latest
+#
+def note_latest(latest):
+  """
+  Records the newest pricedate in the prices table, dropping every
+  cached entry if it's newer than the last one seen
+
+  Parameters
+  ----------
+  latest: newest pricedate (YYYY-MM-DD), or None if prices is empty
+
+  Returns
+  -------
+  nothing
+  """
+  global _latest
+
+  if latest is None:
+    return
+
+  with _lock:
+    if _latest is not None and latest > _latest:
+      _entries.clear()
+      _stats["invalidations"] += 1
+    if _latest is None or latest > _latest:
+      _latest = latest
+
+
+###################################################################
+#
+# put
+#
+def put(cardname, date, price, pricedate):
+  """
+  Caches a price found for (cardname, date)
+
+  Parameters
+  ----------
+  cardname: card name, as stored in the cards table,
+  date: requested date (YYYY-MM-DD),
+  price: the price found,
+  pricedate: the date that price was recorded (YYYY-MM-DD)
+
+  Returns
+  -------
+  nothing
+  """
+  expires = time.monotonic() + ENTRY_TTL
+
+  with _lock:
+    _entries[(cardname, date)] = (price, pricedate, expires)
+    _entries.move_to_end((cardname, date))
+    while len(_entries) > MAX_ENTRIES:
+      _entries.popitem(last=False)
+
+
+def get_stats():
+  with _lock:
+    return dict(_stats, entries=len(_entries), latest=_latest)
+
+
+def clear():
+  with _lock:
+    _entries.clear()
@@ -0,0 +1,129 @@
+#
+# pricechanges.py
+#
+# Maintains the price_changes table: for every tracked card and
+# each standard window (1, 7, 30, 90 and 365 days), the card's
+# latest price, its price windowdays earlier, the difference, and
+# the lowest / highest price seen within the window. fetch_prices
+# refreshes it right after each daily ingest so read endpoints can
+# answer those windows with an index lookup instead of recomputing
+# from the raw prices table.
+#
+
+import datatier
+
+
+WINDOWS = (1, 7, 30, 90, 365)
+
+
+###################################################################
+#
+# refresh
+#
+def refresh(conn, pricedate):
+  """
+  Recomputes every card's price_changes rows as of pricedate
+
+  Parameters
+  ----------
+  conn: database connection,
+  pricedate: the date just ingested (YYYY-MM-DD)
+
+  Returns
+  -------
+  number of cards refreshed (the same for every window)
+  """
+
+  # one set-based statement per window; cards without a price
+  # windowdays ago get NULL prevprice / diff. The update targets are
+  # qualified since price, setcode, minprice and maxprice are also
+  # columns of the joined tables, which MySQL rejects as ambiguous
+  sql = """INSERT INTO price_changes(cardname, windowdays, asofdate, price, setcode,
+                                     prevprice, diff, minprice, maxprice)
+           SELECT t.cardname, %s, t.pricedate, t.price, t.setcode,
+                  p.price, ROUND(t.price - p.price, 2), r.minprice, r.maxprice
+           FROM prices t
+           LEFT JOIN prices p
+             ON p.cardname = t.cardname AND p.pricedate = DATE_SUB(t.pricedate, INTERVAL %s DAY)
+           JOIN (SELECT cardname, MIN(price) AS minprice, MAX(price) AS maxprice
+                 FROM prices
+                 WHERE pricedate BETWEEN DATE_SUB(%s, INTERVAL %s DAY) AND %s
+                 GROUP BY cardname) r
+             ON r.cardname = t.cardname
+           WHERE t.pricedate = %s
+           ON DUPLICATE KEY UPDATE
+             price_changes.asofdate = VALUES(asofdate),
+             price_changes.price = VALUES(price),
+             price_changes.setcode = VALUES(setcode),
+             price_changes.prevprice = VALUES(prevprice),
+             price_changes.diff = VALUES(diff),
+             price_changes.minprice = VALUES(minprice),
+             price_changes.maxprice = VALUES(maxprice);"""
+
+  for days in WINDOWS:
+    datatier.perform_action(conn, sql, [days, days, pricedate, days, pricedate, pricedate])
+
+  sql = "SELECT COUNT(*) FROM prices WHERE pricedate = %s;"
+  row = datatier.retrieve_one_row(conn, sql, [pricedate])
+
+  return row[0]
+
+
+###################################################################
+#
+# is_refreshed
+#
+def is_refreshed(conn, numdays, asofdate):
+  """
+  Returns True if price_changes has been refreshed for a standard
+  window as of asofdate (whether or not any card's change is known)
+
+  Parameters
+  ----------
+  conn: database connection,
+  numdays: window length in days,
+  asofdate: the date the window ends on (YYYY-MM-DD)
+
+  Returns
+  -------
+  True or False
+  """
+  if numdays not in WINDOWS:
+    return False
+
+  sql = "SELECT 1 FROM price_changes WHERE windowdays = %s AND asofdate = %s LIMIT 1;"
+  row = datatier.retrieve_one_row(conn, sql, [numdays, asofdate])
+
+  return len(row) > 0
+
+
+###################################################################
+#
+# best_drop
+#
+def best_drop(conn, numdays, asofdate):
+  """
+  Looks up the card with the biggest price drop over a standard
+  window
+
+  Parameters
+  ----------
+  conn: database connection,
+  numdays: window length in days (must be one of WINDOWS),
+  asofdate: the date the window ends on (YYYY-MM-DD)
+
+  Returns
+  -------
+  (cardname, diff, price, setcode), or () if the table hasn't
+  been refreshed for asofdate
+  """
+  if numdays not in WINDOWS:
+    raise ValueError(f"{numdays} is not a materialized window {WINDOWS}")
+
+  sql = """SELECT cardname, diff, price, setcode
+           FROM price_changes
+           WHERE windowdays = %s AND asofdate = %s AND diff IS NOT NULL
+           ORDER BY diff ASC, cardname ASC
+           LIMIT 1;"""
+
+  return datatier.retrieve_one_row(conn, sql, [numdays, asofdate])
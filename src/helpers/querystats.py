@@ -0,0 +1,269 @@
+#
+# querystats.py
+#
+# Opt-in per-query instrumentation for datatier. When enabled,
+# datatier records the wall time and row count of every statement
+# (and the time taken to acquire a connection), and the handler
+# wrapper below prints a one-line JSON summary at the end of each
+# lambda_handler invocation so it lands in CloudWatch Logs, along
+# with datatier's connection cache counters for the container.
+#
+# Enable by setting the Lambda environment variable
+# MTG_QUERY_STATS=1 (optionally MTG_SLOW_QUERY_MS=<ms>, default
+# 200), or by calling querystats.enable() directly.
+#
+
+import functools
+import json
+import math
+import os
+import re
+import sys
+import time
+
+
+_enabled = os.environ.get("MTG_QUERY_STATS", "0") not in ("", "0", "false", "False")
+_slow_ms = float(os.environ.get("MTG_SLOW_QUERY_MS", "200"))
+
+_queries = []   # one dict per statement executed this invocation
+_connects = []  # one dict per get_dbConn call this invocation
+
+
+###################################################################
+#
+# enable / disable / is_enabled
+#
+def enable(slow_ms=None):
+  """
+  Turns query instrumentation on
+
+  Parameters
+  ----------
+  slow_ms: optional threshold (milliseconds) above which a
+    statement is listed as a slow query in the summary
+
+  Returns
+  -------
+  nothing
+  """
+  global _enabled, _slow_ms
+  _enabled = True
+  if slow_ms is not None:
+    _slow_ms = float(slow_ms)
+
+
+def disable():
+  """
+  Turns query instrumentation off (and discards what was recorded)
+  """
+  global _enabled
+  _enabled = False
+  reset()
+
+
+def is_enabled():
+  return _enabled
+
+
+def reset():
+  """
+  Discards everything recorded so far
+  """
+  _queries.clear()
+  _connects.clear()
+
+
+###################################################################
+#
+# fingerprint
+#
+# Normalizes an SQL statement so that executions differing only in
+# their literal values group together: string and numeric literals
+# and %s placeholders become ?, IN-lists and multi-row VALUES
+# collapse, and whitespace / case are normalized.
+#
+_re_string = re.compile(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.)*\"")
+_re_number = re.compile(r"\b\d+(?:\.\d+)?\b")
+_re_placeholder = re.compile(r"%s")
+_re_list = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_re_values = re.compile(r"(\(\?\+\))(?:\s*,\s*\(\?\+\))+")
+_re_space = re.compile(r"\s+")
+
+
+def fingerprint(sql):
+  """
+  Returns the normalized form of an SQL statement
+
+  Parameters
+  ----------
+  sql: the SQL statement (string)
+
+  Returns
+  -------
+  normalized statement (string)
+  """
+  fp = _re_string.sub("?", sql)
+  fp = _re_placeholder.sub("?", fp)
+  fp = _re_number.sub("?", fp)
+  fp = _re_list.sub("(?+)", fp)
+  fp = _re_values.sub(r"\1", fp)
+  fp = _re_space.sub(" ", fp).strip().rstrip(";").strip()
+  return fp.lower()
+
+
+###################################################################
+#
+# record_query / record_connect
+#
+# Called by datatier; no-ops unless instrumentation is enabled.
+#
+def record_query(sql, seconds, rows, error=None):
+  """
+  Records one executed statement
+
+  Parameters
+  ----------
+  sql: the SQL statement executed,
+  seconds: wall time in seconds,
+  rows: rows returned (SELECT) or affected (action query),
+  error: the exception raised, if the statement failed
+
+  Returns
+  -------
+  nothing
+  """
+  if not _enabled:
+    return
+
+  _queries.append({
+    "fingerprint": fingerprint(sql),
+    "ms": seconds * 1000.0,
+    "rows": rows,
+    "error": None if error is None else str(error)
+  })
+
+
+def record_connect(seconds, cached):
+  """
+  Records one connection acquisition
+
+  Parameters
+  ----------
+  seconds: wall time in seconds,
+  cached: True if a cached connection was reused
+
+  Returns
+  -------
+  nothing
+  """
+  if not _enabled:
+    return
+
+  _connects.append({"ms": seconds * 1000.0, "cached": cached})
+
+
+###################################################################
+#
+# summary
+#
+def _percentile(sorted_values, pct):
+  # nearest-rank percentile over an already sorted list:
+  if len(sorted_values) == 0:
+    return 0.0
+  rank = math.ceil(pct / 100.0 * len(sorted_values))
+  rank = min(max(rank, 1), len(sorted_values))
+  return sorted_values[rank - 1]
+
+
+def summary():
+  """
+  Summarizes everything recorded since the last reset()
+
+  Parameters
+  ----------
+  None
+
+  Returns
+  -------
+  dictionary with per-fingerprint counts, rows and p50/p95/max
+  times, the connection acquire times, and the list of
+  statements slower than the slow-query threshold
+  """
+  by_fp = {}
+  for q in _queries:
+    by_fp.setdefault(q["fingerprint"], []).append(q)
+
+  statements = []
+  for fp, qs in by_fp.items():
+    times = sorted(q["ms"] for q in qs)
+    statements.append({
+      "fingerprint": fp,
+      "count": len(qs),
+      "errors": sum(1 for q in qs if q["error"] is not None),
+      "rows": sum(q["rows"] for q in qs if q["rows"] is not None),
+      "total_ms": round(sum(times), 3),
+      "p50_ms": round(_percentile(times, 50), 3),
+      "p95_ms": round(_percentile(times, 95), 3),
+      "max_ms": round(times[-1], 3)
+    })
+
+  # most expensive first:
+  statements.sort(key=lambda s: s["total_ms"], reverse=True)
+
+  slow = [{"fingerprint": q["fingerprint"], "ms": round(q["ms"], 3), "rows": q["rows"]}
+          for q in _queries if q["ms"] >= _slow_ms]
+
+  return {
+    "queries": len(_queries),
+    "query_ms": round(sum(q["ms"] for q in _queries), 3),
+    "connects": [{"ms": round(c["ms"], 3), "cached": c["cached"]} for c in _connects],
+    "statements": statements,
+    "slow_threshold_ms": _slow_ms,
+    "slow_queries": slow
+  }
+
+
+###################################################################
+#
+# instrumented
+#
+# Decorator for lambda_handler: clears the per-invocation records
+# on entry and prints the JSON summary on exit (whether the
+# handler returned normally or raised).
+#
+def instrumented(handler):
+  """
+  Wraps a lambda_handler so each invocation emits a query summary
+
+  Parameters
+  ----------
+  handler: the lambda_handler(event, context) function
+
+  Returns
+  -------
+  the wrapped handler
+  """
+  @functools.wraps(handler)
+  def wrapper(event, context):
+    if not _enabled:
+      return handler(event, context)
+
+    reset()
+    start = time.perf_counter()
+    try:
+      return handler(event, context)
+    finally:
+      report = summary()
+      report["handler"] = handler.__module__
+      report["handler_ms"] = round((time.perf_counter() - start) * 1000.0, 3)
+
+      # datatier imports this module, so look it up rather than
+      # importing it (it's only loaded if the handler uses it):
+      datatier = sys.modules.get("datatier")
+      if datatier is not None:
+        report["conn_cache"] = datatier.get_conn_stats()
+
+      print(json.dumps({"query_stats": report}))
+      reset()
+
+  return wrapper
@@ -0,0 +1,200 @@
+#
+# responseformat.py
+#
+# Response encoding for the list endpoints (/prices, /cards).
+#
+# Columnar format: instead of an array of objects repeating every
+# key for every row, one array per field. Fields with few distinct
+# values (card names, set codes, dates) are dictionary-encoded: the
+# column holds indexes into a list of the distinct values. Clients
+# opt in with ?format=columnar or an Accept header of
+# application/vnd.mtgpricetracker.columnar+json.
+#
+# Compression: for a REST API, let API Gateway do it by setting the
+# API's minimumCompressionSize (e.g. to GZIP_THRESHOLD); it gzips
+# responses for clients that send Accept-Encoding: gzip, with no
+# binary media types needed. Clients of an HTTP API, which can't,
+# opt in with ?compress=gzip (plus Accept-Encoding: gzip): bodies
+# larger than GZIP_THRESHOLD bytes are then gzipped here and returned
+# base64 encoded (isBase64Encoded) with Content-Encoding: gzip. It's
+# opt-in because a REST API only decodes that back to binary if the
+# API's binary media types match the request's Accept header, and
+# plain clients (which send Accept-Encoding: gzip by default) would
+# otherwise get base64 text.
+#
+
+import base64
+import gzip
+
+
+COLUMNAR_MEDIA_TYPE = "application/vnd.mtgpricetracker.columnar+json"
+
+GZIP_THRESHOLD = 1024  # bytes; smaller bodies aren't worth it
+
+
+###################################################################
+#
+# _headers
+#
+# API Gateway passes request headers through with whatever case the
+# client used (and may send None when there are none).
+#
+def _headers(event):
+  headers = event.get("headers") or {}
+  return {k.lower(): v for k, v in headers.items() if v is not None}
+
+
+###################################################################
+#
+# wants_columnar
+#
+def wants_columnar(event):
+  """
+  Returns True if the request asked for the columnar format
+
+  Parameters
+  ----------
+  event: the lambda event
+
+  Returns
+  -------
+  True or False
+  """
+  params = event.get("queryStringParameters") or {}
+  if "format" in params:
+    if params["format"] not in ("rows", "columnar"):
+      raise Exception("format must be 'rows' or 'columnar'")
+    return params["format"] == "columnar"
+
+  return COLUMNAR_MEDIA_TYPE in _headers(event).get("accept", "")
+
+
+###################################################################
+#
+# accepts_gzip
+#
+def accepts_gzip(event):
+  encodings = _headers(event).get("accept-encoding", "")
+  for encoding in encodings.split(","):
+    parts = encoding.strip().split(";")
+    if parts[0].strip().lower() in ("gzip", "*"):
+      # honor an explicit q=0, which means "not gzip"
+      for param in parts[1:]:
+        name, _, value = param.strip().partition("=")
+        if name == "q" and value.strip() in ("0", "0.0", "0.00", "0.000"):
+          return False
+      return True
+
+  return False
+
+
+###################################################################
+#
+# wants_gzip
+#
+def wants_gzip(event):
+  """
+  Returns True if the request opted in to gzipping here (see above)
+
+  Parameters
+  ----------
+  event: the lambda event
+
+  Returns
+  -------
+  True or False
+  """
+  params = event.get("queryStringParameters") or {}
+  compress = params.get("compress", "none")
+  if compress not in ("none", "gzip"):
+    raise Exception("compress must be 'none' or 'gzip'")
+
+  return compress == "gzip" and accepts_gzip(event)
+
+
+###################################################################
+#
+# columnar
+#
+def columnar(records, fields, dict_fields=()):
+  """
+  Builds the columnar layout of a list of records
+
+  Parameters
+  ----------
+  records: iterable of tuples, one value per field,
+  fields: the field names, in tuple order,
+  dict_fields: fields to dictionary-encode
+
+  Returns
+  -------
+  dictionary {"format": "columnar", "count": n,
+  "columns": {field: [values or indexes]},
+  "dictionaries": {field: [distinct values]}}
+  """
+  columns = {field: [] for field in fields}
+  dictionaries = {field: [] for field in dict_fields}
+  lookups = {field: {} for field in dict_fields}
+
+  count = 0
+  for record in records:
+    for field, value in zip(fields, record):
+      if field in lookups:
+        lookup = lookups[field]
+        index = lookup.get(value)
+        if index is None:
+          index = len(dictionaries[field])
+          lookup[value] = index
+          dictionaries[field].append(value)
+        value = index
+      columns[field].append(value)
+    count += 1
+
+  return {
+    "format": "columnar",
+    "count": count,
+    "columns": columns,
+    "dictionaries": dictionaries
+  }
+
+
+###################################################################
+#
+# make_response
+#
+def make_response(event, body, statusCode=200):
+  """
+  Builds the lambda proxy response for a JSON body, gzipping it if
+  the client asked for ?compress=gzip, accepts gzip and it's big
+  enough to be worth it
+
+  Parameters
+  ----------
+  event: the lambda event,
+  body: the JSON body (string),
+  statusCode: the HTTP status
+
+  Returns
+  -------
+  the response dictionary
+  """
+  headers = {
+    "Content-Type": "application/json",
+    "Vary": "Accept, Accept-Encoding"
+  }
+
+  if len(body) >= GZIP_THRESHOLD and wants_gzip(event):
+    compressed = gzip.compress(body.encode("utf-8"), compresslevel=6)
+    headers["Content-Encoding"] = "gzip"
+    return {
+      'statusCode': statusCode,
+      'headers': headers,
+      'isBase64Encoded': True,
+      'body': base64.b64encode(compressed).decode("ascii")
+    }
+
+  return {
+    'statusCode': statusCode,
+    'headers': headers,
+    'body': body
+  }
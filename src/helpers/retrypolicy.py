@@ -0,0 +1,250 @@
+#
+# retrypolicy.py
+#
+# Retry policy for calls to web services: exponential backoff with
+# jitter, honoring Retry-After, only retrying status codes and
+# exceptions that are worth retrying, a per-host circuit breaker
+# that fails fast once a host keeps failing, and a total deadline
+# so a caller never spends its whole Lambda timeout retrying.
+#
+# Nothing here depends on a particular HTTP library; the caller
+# passes a function that makes one attempt, plus a function that
+# pulls the status code out of whatever response it returns.
+#
+
+import email.utils
+import random
+import threading
+import time
+import urllib.parse
+
+
+###################################################################
+#
+# CircuitOpenError
+#
+# Raised instead of making a request when the host's circuit is
+# open.
+#
+class CircuitOpenError(Exception):
+
+  def __init__(self, host, retry_in):
+    super().__init__(f"circuit open for {host}, retry in {retry_in:.1f}s")
+    self.host = host
+    self.retry_in = retry_in
+
+
+###################################################################
+#
+# CircuitBreaker
+#
+# Tracks consecutive failures per host. After failure_threshold
+# failures in a row the circuit opens and calls to that host fail
+# immediately for reset_timeout seconds; after that one trial call
+# is let through (half-open), which re-opens the circuit if it fails
+# (a 5xx or an exception) and closes it on any other outcome,
+# including a 429: the host is up, just asking us to slow down.
+#
+class CircuitBreaker:
+
+  def __init__(self, failure_threshold=5, reset_timeout=30.0):
+    self.failure_threshold = failure_threshold
+    self.reset_timeout = reset_timeout
+    self.failures = {}    # host => consecutive failures
+    self.opened_at = {}   # host => time.monotonic() when opened
+    self.trial = set()    # hosts with a half-open trial in flight
+    self.lock = threading.Lock()
+
+  def before_call(self, host):
+    """
+    Raises CircuitOpenError if calls to host should not be made
+    """
+    with self.lock:
+      if host not in self.opened_at:
+        return
+
+      elapsed = time.monotonic() - self.opened_at[host]
+      if elapsed < self.reset_timeout or host in self.trial:
+        raise CircuitOpenError(host, max(self.reset_timeout - elapsed, 0.0))
+
+      # half-open: let this one call through as a trial
+      self.trial.add(host)
+
+  def record_success(self, host):
+    with self.lock:
+      self.failures.pop(host, None)
+      self.opened_at.pop(host, None)
+      self.trial.discard(host)
+
+  def record_failure(self, host):
+    with self.lock:
+      self.failures[host] = self.failures.get(host, 0) + 1
+      if host in self.trial or self.failures[host] >= self.failure_threshold:
+        self.opened_at[host] = time.monotonic()
+      self.trial.discard(host)
+
+  def is_open(self, host):
+    with self.lock:
+      return host in self.opened_at
+
+
+###################################################################
+#
+# parse_retry_after
+#
+def parse_retry_after(value):
+  """
+  Parses a Retry-After header value
+
+  Parameters
+  ----------
+  value: header value, either delay-seconds or an HTTP-date
+    (string, or None if the header was not sent)
+
+  Returns
+  -------
+  # of seconds to wait (float), or None if absent / unparseable
+  """
+  if value is None:
+    return None
+
+  value = value.strip()
+  try:
+    return max(float(value), 0.0)
+  except ValueError:
+    pass
+
+  try:
+    when = email.utils.parsedate_to_datetime(value)
+    return max(when.timestamp() - time.time(), 0.0)
+  except (TypeError, ValueError, IndexError, OverflowError):
+    return None
+
+
+###################################################################
+#
+# RetryPolicy
+#
+class RetryPolicy:
+
+  def __init__(self,
+               max_attempts=3,
+               base_delay=0.5,
+               max_delay=8.0,
+               deadline=30.0,
+               retry_statuses=(429, 502, 503, 504),
+               retry_exceptions=(ConnectionError, TimeoutError),
+               max_retry_after=60.0,
+               breaker=None):
+    """
+    Parameters
+    ----------
+    max_attempts: max # of attempts, including the first,
+    base_delay: backoff before the 2nd attempt, in seconds; doubles
+      after each further attempt,
+    max_delay: cap on any single backoff, in seconds,
+    deadline: total seconds allowed across all attempts and sleeps
+      (None for no limit),
+    retry_statuses: status codes that are retried; any other
+      status is returned to the caller as is,
+    retry_exceptions: exception types that are retried; any other
+      exception is raised to the caller immediately,
+    max_retry_after: cap on a server's Retry-After, in seconds,
+    breaker: CircuitBreaker shared across calls (None to disable)
+    """
+    self.max_attempts = max_attempts
+    self.base_delay = base_delay
+    self.max_delay = max_delay
+    self.deadline = deadline
+    self.retry_statuses = frozenset(retry_statuses)
+    self.retry_exceptions = tuple(retry_exceptions)
+    self.max_retry_after = max_retry_after
+    self.breaker = breaker
+
+  def backoff(self, attempt, retry_after=None):
+    """
+    Returns the # of seconds to sleep after the given (1-based)
+    failed attempt: the server's Retry-After if it sent one,
+    otherwise "full jitter" exponential backoff
+    """
+    if retry_after is not None:
+      return min(retry_after, self.max_retry_after)
+
+    ceiling = min(self.max_delay, self.base_delay * (2 ** (attempt - 1)))
+    return random.uniform(0, ceiling)
+
+  def execute(self, url, attempt_fn, status_of, deadline=None):
+    """
+    Calls attempt_fn() until it returns a response whose status
+    is not retryable, attempts run out, or the deadline would be
+    passed by sleeping again
+
+    Parameters
+    ----------
+    url: the url being called (its host keys the circuit breaker),
+    attempt_fn: function making one request, returning a response,
+    status_of: function returning the status code of a response,
+    deadline: optional override of self.deadline for this call
+
+    Returns
+    -------
+    the last response received; raises the last exception if the
+    final attempt raised, or CircuitOpenError if the host's circuit
+    is open
+    """
+    host = urllib.parse.urlsplit(url).netloc
+    budget = self.deadline if deadline is None else deadline
+    give_up_at = None if budget is None else time.monotonic() + budget
+
+    attempt = 0
+    while True:
+      attempt += 1
+
+      if self.breaker is not None:
+        self.breaker.before_call(host)
+
+      retry_after = None
+      try:
+        response = attempt_fn()
+      except Exception as err:
+        if self.breaker is not None:
+          self.breaker.record_failure(host)
+        if not isinstance(err, self.retry_exceptions):
+          raise
+        delay = self.backoff(attempt)
+        if not self._can_retry(attempt, give_up_at, delay):
+          raise
+        time.sleep(delay)
+        continue
+
+      if status_of(response) not in self.retry_statuses:
+        if self.breaker is not None:
+          self.breaker.record_success(host)
+        return response
+
+      # 429 means the host is up but wants us to slow down, which
+      # Retry-After / backoff handles, so it counts as a success
+      # (closing a half-open circuit); only 5xx counts against the
+      # host's circuit:
+      if self.breaker is not None:
+        if status_of(response) >= 500:
+          self.breaker.record_failure(host)
+        else:
+          self.breaker.record_success(host)
+
+      headers = getattr(response, "headers", None)
+      if headers is not None:
+        retry_after = parse_retry_after(headers.get("Retry-After"))
+
+      delay = self.backoff(attempt, retry_after)
+      if not self._can_retry(attempt, give_up_at, delay):
+        return response
+
+      time.sleep(delay)
+
+  def _can_retry(self, attempt, give_up_at, delay):
+    if attempt >= self.max_attempts:
+      return False
+    if give_up_at is not None and time.monotonic() + delay > give_up_at:
+      return False
+    return True
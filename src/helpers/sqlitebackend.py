@@ -0,0 +1,302 @@
+#
+# sqlitebackend.py
+#
+# Embedded SQLite backend for datatier, so the lambda handlers can
+# run (and be profiled) locally without an RDS instance. Select it
+# with backend = sqlite in the [database] section of the config
+# file (see bootstrap.py); datatier.get_sqlite_dbConn opens it.
+#
+# The connection / cursor wrappers below look enough like pymysql's
+# for datatier's functions, and translate the MySQL dialect the
+# handlers are written in as each statement is executed:
+#   %s placeholders                => ?
+#   DATE_SUB(d, INTERVAL n DAY)    => date(d, '-' || n || ' days')
+#   DATEDIFF(a, b)                 => CAST(julianday(a) - julianday(b) AS INTEGER)
+#   INSERT IGNORE                  => INSERT OR IGNORE
+#   ON DUPLICATE KEY UPDATE [t.]c = VALUES(c)
+#                                  => ON CONFLICT DO UPDATE SET c = excluded.c
+# (the last needs SQLite 3.35+). SQLite has no DATE type, so dates
+# are stored as YYYY-MM-DD text and any YYYY-MM-DD string in a
+# result row comes back as a datetime.date, like pymysql returns.
+#
+# The schema mirrors src/mtgpricetracker.sql, indexes included, and
+# is created when a new database file is opened.
+#
+#   python sqlitebackend.py <dbfile> [numcards numdays]
+#
+# creates a database file, optionally filled with numcards cards of
+# random-walk prices over the last numdays days for benchmarking.
+#
+
+import datetime
+import random
+import re
+import sqlite3
+import sys
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cards
+(
+    cardid       INTEGER PRIMARY KEY AUTOINCREMENT,
+    cardname     varchar(256) not null,
+    dateadded    date not null
+);
+CREATE UNIQUE INDEX IF NOT EXISTS uq_cards_name ON cards (cardname);
+
+CREATE TABLE IF NOT EXISTS prices
+(
+    priceid      INTEGER PRIMARY KEY AUTOINCREMENT,
+    setcode      varchar(8) not null,
+    price        float not null,
+    cardname     varchar(256) not null,
+    pricedate    date not null,
+    imagekey     varchar(256) not null
+);
+CREATE UNIQUE INDEX IF NOT EXISTS uq_prices_card_date ON prices (cardname, pricedate);
+CREATE INDEX IF NOT EXISTS ix_prices_date ON prices (pricedate);
+CREATE INDEX IF NOT EXISTS ix_prices_set ON prices (setcode, priceid);
+
+CREATE TABLE IF NOT EXISTS price_changes
+(
+    cardname     varchar(256) not null,
+    windowdays   int not null,
+    asofdate     date not null,
+    price        float not null,
+    setcode      varchar(8) not null,
+    prevprice    float,
+    diff         float,
+    minprice     float not null,
+    maxprice     float not null,
+    PRIMARY KEY  (cardname, windowdays)
+);
+CREATE INDEX IF NOT EXISTS ix_price_changes_window ON price_changes (windowdays, asofdate, diff);
+"""
+
+# same starting ids as the MySQL schema's AUTO_INCREMENT values:
+START_IDS = {"cards": 10001, "prices": 1001}
+
+
+###################################################################
+#
+# translate
+#
+_re_date_sub = re.compile(r"DATE_SUB\(\s*([^,()]+?)\s*,\s*INTERVAL\s+([^()]+?)\s+DAY\s*\)", re.I)
+_re_datediff = re.compile(r"DATEDIFF\(\s*([^,()]+?)\s*,\s*([^,()]+?)\s*\)", re.I)
+_re_insert_ignore = re.compile(r"\bINSERT\s+IGNORE\b", re.I)
+_re_on_duplicate = re.compile(r"\bON\s+DUPLICATE\s+KEY\s+UPDATE\b", re.I)
+_re_values_ref = re.compile(r"\bVALUES\(\s*(\w+)\s*\)", re.I)
+_re_qualified_target = re.compile(r"\b\w+\.(\w+)(\s*=)")
+
+
+def translate(sql):
+  """
+  Rewrites a MySQL-dialect statement, as written in the handlers,
+  into SQLite's dialect
+
+  Parameters
+  ----------
+  sql: the statement (parameterized with %s)
+
+  Returns
+  -------
+  the SQLite statement (parameterized with ?)
+  """
+  sql = _re_date_sub.sub(r"date(\1, '-' || (\2) || ' days')", sql)
+  sql = _re_datediff.sub(r"CAST(julianday(\1) - julianday(\2) AS INTEGER)", sql)
+  sql = _re_insert_ignore.sub("INSERT OR IGNORE", sql)
+
+  parts = _re_on_duplicate.split(sql, maxsplit=1)
+  if len(parts) == 2:
+    # VALUES(col) only means "the new value" after ON DUPLICATE KEY
+    # UPDATE; before it, VALUES (...) is the row list. SQLite's SET
+    # only takes bare column names, so drop any table qualifier
+    assignments = _re_qualified_target.sub(r"\1\2", parts[1])
+    sql = parts[0] + "ON CONFLICT DO UPDATE SET" + _re_values_ref.sub(r"excluded.\1", assignments)
+
+  return sql.replace("%s", "?").replace("%%", "%")
+
+
+###################################################################
+#
+# result rows
+#
+_re_iso_date = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+
+def _convert(row):
+  if row is None:
+    return None
+  return tuple(datetime.date.fromisoformat(v) if isinstance(v, str) and _re_iso_date.fullmatch(v) else v
+               for v in row)
+
+
+def _param(value):
+  if isinstance(value, (datetime.date, datetime.datetime)):
+    return value.isoformat()
+  return value
+
+
+###################################################################
+#
+# Cursor
+#
+class Cursor:
+
+  def __init__(self, cursor):
+    self._cursor = cursor
+
+  @property
+  def rowcount(self):
+    return self._cursor.rowcount
+
+  def execute(self, sql, parameters=()):
+    self._cursor.execute(translate(sql), [_param(v) for v in parameters or ()])
+    return self._cursor.rowcount
+
+  def executemany(self, sql, rows):
+    self._cursor.executemany(translate(sql), ([_param(v) for v in row] for row in rows))
+    return self._cursor.rowcount
+
+  def fetchone(self):
+    return _convert(self._cursor.fetchone())
+
+  def fetchmany(self, size):
+    return [_convert(row) for row in self._cursor.fetchmany(size)]
+
+  def fetchall(self):
+    return [_convert(row) for row in self._cursor.fetchall()]
+
+  def close(self):
+    self._cursor.close()
+
+
+###################################################################
+#
+# Connection
+#
+class Connection:
+
+  backend = "sqlite"
+
+  def __init__(self, path):
+    # handlers only use a connection from one thread at a time, but
+    # it's cached across invocations, which may not be the same one
+    self._conn = sqlite3.connect(path, check_same_thread=False)
+    create_schema(self._conn)
+
+  def cursor(self, cursorclass=None):
+    # SQLite cursors already step through results lazily, so the
+    # streaming cursor class datatier asks MySQL for isn't needed
+    return Cursor(self._conn.cursor())
+
+  def commit(self):
+    self._conn.commit()
+
+  def rollback(self):
+    self._conn.rollback()
+
+  def ping(self, reconnect=False):
+    self._conn.execute("SELECT 1").fetchone()
+
+  def close(self):
+    self._conn.close()
+
+
+###################################################################
+#
+# create_schema
+#
+def create_schema(conn):
+  """
+  Creates the tables and indexes if they don't exist yet
+
+  Parameters
+  ----------
+  conn: an sqlite3 connection
+
+  Returns
+  -------
+  nothing
+  """
+  conn.executescript(SCHEMA)
+
+  for table, start in START_IDS.items():
+    row = conn.execute("SELECT COUNT(*) FROM sqlite_sequence WHERE name = ?", [table]).fetchone()
+    if row[0] == 0:
+      conn.execute("INSERT INTO sqlite_sequence(name, seq) VALUES (?, ?)", [table, start - 1])
+
+  conn.commit()
+
+
+###################################################################
+#
+# connect
+#
+def connect(path):
+  """
+  Opens (creating if needed) an SQLite database
+
+  Parameters
+  ----------
+  path: database file, or ":memory:"
+
+  Returns
+  -------
+  a Connection, usable with datatier's functions
+  """
+  return Connection(path)
+
+
+###################################################################
+#
+# fill_synthetic
+#
+def fill_synthetic(conn, numcards, numdays, seed=0):
+  """
+  Fills a database with random-walk prices, for benchmarking
+
+  Parameters
+  ----------
+  conn: a Connection,
+  numcards: # of cards to track,
+  numdays: # of days of prices, ending today
+
+  Returns
+  -------
+  # of price rows inserted
+  """
+  rng = random.Random(seed)
+  today = datetime.date.today()
+  first = today - datetime.timedelta(days=numdays - 1)
+
+  cursor = conn.cursor()
+  cursor.executemany("INSERT INTO cards(cardname, dateadded) VALUES (%s, %s);",
+                     [[f"Card+{i:05d}", first] for i in range(numcards)])
+
+  rows = []
+  for i in range(numcards):
+    price = rng.uniform(0.25, 150.0)
+    setcode = f"s{i % 40:02d}"
+    for day in range(numdays):
+      price = max(0.1, price * (1.0 + rng.gauss(0.0, 0.02)))
+      rows.append([setcode, round(price, 2), f"Card+{i:05d}", first + datetime.timedelta(days=day), '---'])
+
+  cursor.executemany("INSERT INTO prices(setcode, price, cardname, pricedate, imagekey) VALUES (%s, %s, %s, %s, %s);",
+                     rows)
+  conn.commit()
+  cursor.close()
+
+  return len(rows)
+
+
+if __name__ == "__main__":
+  if len(sys.argv) not in (2, 4):
+    print("usage: python sqlitebackend.py <dbfile> [numcards numdays]")
+    sys.exit(1)
+
+  conn = connect(sys.argv[1])
+  if len(sys.argv) == 4:
+    count = fill_synthetic(conn, int(sys.argv[2]), int(sys.argv[3]))
+    print(f"inserted {count} prices")
+  conn.close()
@@ -0,0 +1,92 @@
+#
+# timeseries.py
+#
+# Downsampling of daily price series into weekly / monthly OHLC
+# (open, high, low, close) buckets. Works on whole NumPy arrays at
+# once: the rows for every requested card are bucketed in a single
+# vectorized pass rather than a Python loop per card per day.
+#
+
+import numpy as np
+
+
+INTERVALS = ("daily", "weekly", "monthly")
+
+
+###################################################################
+#
+# bucket_starts
+#
+def bucket_starts(dates, interval):
+  """
+  Maps each date to the first day of its bucket
+
+  Parameters
+  ----------
+  dates: numpy array of datetime64[D],
+  interval: "daily", "weekly" (weeks start Monday) or "monthly"
+
+  Returns
+  -------
+  numpy array of datetime64[D], same length as dates
+  """
+  if interval == "daily":
+    return dates
+  if interval == "weekly":
+    # day 0 (1970-01-01) was a Thursday, so +3 makes Monday 0:
+    days = dates.astype("int64")
+    return (days - (days + 3) % 7).astype("datetime64[D]")
+  if interval == "monthly":
+    return dates.astype("datetime64[M]").astype("datetime64[D]")
+
+  raise ValueError(f"interval must be one of {INTERVALS}")
+
+
+###################################################################
+#
+# ohlc
+#
+def ohlc(series_ids, dates, prices, interval):
+  """
+  Downsamples many price series to OHLC buckets in one pass
+
+  Parameters
+  ----------
+  series_ids: numpy int array saying which series each row is in,
+  dates: numpy datetime64[D] array,
+  prices: numpy float array,
+    (all three the same length and sorted by series, then date)
+  interval: "daily", "weekly" or "monthly"
+
+  Returns
+  -------
+  dictionary of numpy arrays, one element per bucket (sorted by
+  series, then bucket): "series", "date" (bucket start), "open",
+  "high", "low", "close" and "count" (# of daily prices in it)
+  """
+  n = len(prices)
+  if n == 0:
+    empty = np.array([], dtype="float64")
+    return {"series": np.array([], dtype="int64"), "date": np.array([], dtype="datetime64[D]"),
+            "open": empty, "high": empty, "low": empty, "close": empty,
+            "count": np.array([], dtype="int64")}
+
+  keys = bucket_starts(dates, interval)
+
+  # a new bucket starts wherever the series or the bucket changes:
+  boundary = np.empty(n, dtype=bool)
+  boundary[0] = True
+  boundary[1:] = (series_ids[1:] != series_ids[:-1]) | (keys[1:] != keys[:-1])
+
+  starts = np.flatnonzero(boundary)
+  ends = np.append(starts[1:], n)  # exclusive
+
+  return {
+    "series": series_ids[starts],
+    "date": keys[starts],
+    "open": prices[starts],
+    "high": np.maximum.reduceat(prices, starts),
+    "low": np.minimum.reduceat(prices, starts),
+    "close": prices[ends - 1],
+    "count": ends - starts
+  }
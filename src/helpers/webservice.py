@@ -1,59 +1,342 @@
 import urllib3
 import logging
+import retrypolicy
+import threading
 import time
 
+from concurrent.futures import ThreadPoolExecutor
+
+
+###################################################################
+#
+# shared connection pool
+#
+# One PoolManager for the whole module, created on first use and
+# kept for the life of the container, so repeated calls (and warm
+# Lambda invocations) reuse the same keep-alive TCP/TLS connections
+# instead of doing a fresh DNS lookup + handshake every request.
+#
+_pool_settings = {
+  "num_pools": 4,          # distinct hosts kept open
+  "maxsize": 8,            # max connections kept per host
+  "connect_timeout": 5.0,  # seconds
+  "read_timeout": 30.0,    # seconds
+  "headers": {
+    "Accept-Encoding": "gzip",
+    "Accept": "application/json;q=0.9,*/*;q=0.8",
+    "User-Agent": "mtgpricetracker/1.0"
+  }
+}
+
+_https = None
+
+_request_count = 0
+_stats_lock = threading.Lock()
+
+
+def configure_pool(num_pools=None, maxsize=None, connect_timeout=None,
+                   read_timeout=None, headers=None):
+  """
+  Changes the shared connection pool settings. Any existing pool
+  is closed, and a new one is created with these settings on the
+  next request. Arguments left as None keep their current value.
+
+  Parameters
+  ----------
+  num_pools: # of distinct hosts to keep connections open to,
+  maxsize: max # of connections kept open per host,
+  connect_timeout: seconds to wait for a connection,
+  read_timeout: seconds to wait for a response,
+  headers: dictionary of headers sent with every request
+
+  Returns
+  -------
+  nothing
+  """
+  global _https
+
+  if num_pools is not None:
+    _pool_settings["num_pools"] = num_pools
+  if maxsize is not None:
+    _pool_settings["maxsize"] = maxsize
+  if connect_timeout is not None:
+    _pool_settings["connect_timeout"] = connect_timeout
+  if read_timeout is not None:
+    _pool_settings["read_timeout"] = read_timeout
+  if headers is not None:
+    _pool_settings["headers"] = dict(headers)
+
+  if _https is not None:
+    _https.clear()
+    _https = None
+
+
+def get_pool():
+  """
+  Returns the shared urllib3.PoolManager, creating it if needed
+  """
+  global _https
+
+  if _https is None:
+    _https = urllib3.PoolManager(
+      num_pools=_pool_settings["num_pools"],
+      maxsize=_pool_settings["maxsize"],
+      block=False,
+      headers=_pool_settings["headers"],
+      timeout=urllib3.Timeout(connect=_pool_settings["connect_timeout"],
+                              read=_pool_settings["read_timeout"]),
+      retries=False)  # we do our own retrying below
+
+  return _https
+
+
+def get_pool_stats():
+  """
+  Returns counters for the shared connection pool
+
+  Parameters
+  ----------
+  None
+
+  Returns
+  -------
+  dictionary with "requests" (requests sent), "connections_created"
+  (new TCP/TLS connections opened) and "connections_reused"
+  (requests that went out on an already open connection)
+  """
+  created = 0
+  if _https is not None:
+    for key in _https.pools.keys():
+      pool = _https.pools.get(key)
+      if pool is not None:
+        created += pool.num_connections
+
+  return {
+    "requests": _request_count,
+    "connections_created": created,
+    "connections_reused": max(_request_count - created, 0)
+  }
+
+
+###################################################################
+#
+# TokenBucket
+#
+# Thread-safe token bucket rate limiter: tokens refill at `rate`
+# per second up to `capacity`, and acquire() blocks until a token
+# is available. Scryfall asks for no more than ~10 requests per
+# second on average (50-100 ms between requests), so every request
+# this module sends, from any thread, takes a token from the one
+# shared bucket below.
+#
+class TokenBucket:
+
+  def __init__(self, rate, capacity=1):
+    if rate <= 0 or capacity < 1:
+      raise ValueError("rate must be > 0 and capacity >= 1")
+
+    self.rate = float(rate)
+    self.capacity = float(capacity)
+    self.tokens = float(capacity)
+    self.last = time.monotonic()
+    self.lock = threading.Lock()
+
+  def acquire(self):
+    while True:
+      with self.lock:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+
+        if self.tokens >= 1.0:
+          self.tokens -= 1.0
+          return
+
+        wait = (1.0 - self.tokens) / self.rate
+
+      # sleep outside the lock so other threads can refill / check:
+      time.sleep(wait)
+
+
+_limiter = TokenBucket(rate=10.0, capacity=1)
+
+
+def configure_rate_limit(rate, capacity=1):
+  """
+  Replaces the shared rate limiter
+
+  Parameters
+  ----------
+  rate: requests per second allowed on average,
+  capacity: max # of requests allowed in a burst
+
+  Returns
+  -------
+  nothing
+  """
+  global _limiter
+  _limiter = TokenBucket(rate, capacity)
+
+
+###################################################################
+#
+# retry policy
+#
+# Shared by every call so the per-host circuit breaker sees all
+# failures to a host, from every thread.
+#
+_policy = retrypolicy.RetryPolicy(
+  retry_exceptions=(urllib3.exceptions.HTTPError, ConnectionError, TimeoutError),
+  breaker=retrypolicy.CircuitBreaker())
+
+
+def configure_retry(policy):
+  """
+  Replaces the shared retry policy
+
+  Parameters
+  ----------
+  policy: a retrypolicy.RetryPolicy
+
+  Returns
+  -------
+  nothing
+  """
+  global _policy
+  _policy = policy
+
+
+###################################################################
+#
+# response cache
+#
+# Off (None) unless a caller turns it on with configure_cache, e.g.
+#
+#   webservice.configure_cache(httpcache.ResponseCache(
+#     httpcache.DirectoryStore("/tmp/scryfall-cache"), ttl=6*60*60))
+#
+_cache = None
+
+
+def configure_cache(cache):
+  """
+  Sets (or with None, removes) the response cache used by
+  web_service_get
+
+  Parameters
+  ----------
+  cache: an httpcache.ResponseCache, or None
+
+  Returns
+  -------
+  nothing
+  """
+  global _cache
+  _cache = cache
+
+
+def get_cache_stats():
+  """
+  Returns the response cache counters, or {} if there is no cache
+  """
+  if _cache is None:
+    return {}
+  return _cache.get_stats()
+
+
+###################################################################
+#
+# Scryfall base url
+#
+# Every Scryfall request is built with scryfall_url, so pointing
+# configure_base_url at a local stand-in (see src/scryfallstub.py)
+# sends the whole ingest path there instead of the real API.
+#
+SCRYFALL_API = "https://api.scryfall.com"
+
+_base_url = SCRYFALL_API
+
+
+def configure_base_url(url):
+  """
+  Sets the base url of the Scryfall API
+
+  Parameters
+  ----------
+  url: e.g. "https://api.scryfall.com" or "http://localhost:8080"
+
+  Returns
+  -------
+  nothing
+  """
+  global _base_url
+  _base_url = url.rstrip("/")
+
+
+def scryfall_url(path):
+  """
+  Returns the full url of a Scryfall API path (e.g. "/bulk-data")
+  """
+  return _base_url + path
+
+
 ###################################################################
 #
 # web_service_get
 #
 # When calling servers on a network, calls can randomly fail. 
-# The better approach is to repeat at least N times (typically 
-# N=3), and then give up after N tries.
+# The better approach is to retry what is worth retrying (with
+# backoff), and to give up once the retry policy says so.
 #
-def web_service_get(url):
+def web_service_get(url, deadline=None):
   """
-  Submits a GET request to a web service at most 3 times, since 
-  web services can fail to respond e.g. to heavy user or internet 
-  traffic. If the web service responds with status code 200, 400 
-  or 500, we consider this a valid response and return the response.
-  Otherwise we try again, at most 3 times. After 3 attempts the 
-  function returns with the last response.
+  Submits a GET request to a web service, retrying according to
+  the shared retry policy: 429 and 502/503/504 responses and
+  connection errors / timeouts are retried with exponential
+  backoff and jitter (or after the server's Retry-After), any
+  other response is returned immediately. Gives up after the
+  policy's max attempts or deadline and returns the last
+  response.
   
   Parameters
   ----------
-  url: url for calling the web service
+  url: url for calling the web service,
+  deadline: optional total # of seconds to spend on this call,
+    overriding the policy's deadline
   
   Returns
   -------
-  response received from web service
+  response received from web service, or None if the call
+  failed without a response (or the host's circuit is open)
   """
 
+  def attempt():
+    global _request_count
+
+    _limiter.acquire()
+    with _stats_lock:
+      _request_count += 1
+    return https.request('GET', url, headers=headers)
+
   try:
-    retries = 0
-    
-    while True:
-      https = urllib3.PoolManager()
-      response = https.request('GET', url)
-        
-      if response.status in [200, 400, 480, 481, 482, 500]:
-        #
-        # we consider this a successful call and response
-        #
-        break;
-
-      #
-      # failed, try again?
-      #
-      retries = retries + 1
-      if retries < 3:
-        # try at most 3 times
-        time.sleep(retries)
-        continue
-          
-      #
-      # if get here, we tried 3 times, we give up:
-      #
-      break
+    https = get_pool()
+    headers = https.headers
+
+    cache = _cache
+    stale = None
+    if cache is not None:
+      fresh, stale = cache.lookup(url)
+      if fresh is not None:
+        return fresh
+      if stale is not None:
+        headers = dict(https.headers, **stale.validators())
+
+    response = _policy.execute(url, attempt, lambda response: response.status, deadline)
+
+    if cache is not None:
+      if response.status == 304 and stale is not None:
+        return cache.revalidated(url, stale)
+      cache.store_response(url, response)
 
     return response
 
@@ -62,4 +345,63 @@ def web_service_get(url):
     logging.error("web_service_get() failed:")
     logging.error("url: " + url)
     logging.error(e)
-    return None
\ No newline at end of file
+    return None
+
+
+###################################################################
+#
+# web_service_get_many
+#
+# Calls web_service_get for each url using a pool of worker
+# threads, so up to max_concurrency requests are in flight at
+# once (still subject to the shared rate limiter). Results come
+# back in the same order as urls. A deadline covers the whole
+# batch: each call only gets what's left of it, and calls that
+# haven't started by then are not made.
+#
+def web_service_get_many(urls, max_concurrency=4, deadline=None):
+  """
+  Submits GET requests for a list of urls concurrently, each with
+  the same retry behavior as web_service_get
+
+  Parameters
+  ----------
+  urls: list of urls to call,
+  max_concurrency: max # of requests in flight at once,
+  deadline: optional total # of seconds to spend on the batch,
+    overriding the retry policy's per-call deadline
+
+  Returns
+  -------
+  (responses, latencies): responses[i] is the response for urls[i]
+  (None if that call failed or was not made in time), and
+  latencies[i] is the wall time in seconds that call took,
+  including any retries and rate limiting
+  """
+
+  if max_concurrency < 1:
+    raise ValueError("max_concurrency must be at least 1")
+
+  give_up_at = None if deadline is None else time.monotonic() + deadline
+
+  def timed_get(url):
+    start = time.perf_counter()
+    if give_up_at is None:
+      response = web_service_get(url)
+    elif time.monotonic() < give_up_at:
+      response = web_service_get(url, give_up_at - time.monotonic())
+    else:
+      response = None
+    return (response, time.perf_counter() - start)
+
+  if len(urls) == 0:
+    return ([], [])
+
+  workers = min(max_concurrency, len(urls))
+  with ThreadPoolExecutor(max_workers=workers) as executor:
+    results = list(executor.map(timed_get, urls))
+
+  responses = [r[0] for r in results]
+  latencies = [r[1] for r in results]
+
+  return (responses, latencies)
@@ -6,84 +6,128 @@
 #
 
 import json
-import boto3
-import os
-import uuid
-import base64
-import pathlib
-import src.datatier as datatier
-import src.webservice as webservice
-import urllib.parse
-import string
-import cryptography
+import bootstrap
+import datatier
+import querystats
+import webservice
+import bulkdata
+import pricechanges
+import time
 from datetime import date
 
-from configparser import ConfigParser
 
-def lambda_handler(event, context):
-  try:
-    print("**STARTING**")
-    print("**fetching fetchland info...**")
-    
-    #
-    # setup AWS based on config file:
-    #
-    config_file = 'mtgpricetracker.ini'
-    os.environ['AWS_SHARED_CREDENTIALS_FILE'] = config_file
-    
-    configur = ConfigParser()
-    configur.read(config_file)
-    
-    #
-    # configure for S3 access:
-    #
-    s3_profile = 's3readwrite'
-    boto3.setup_default_session(profile_name=s3_profile)
-    
-    bucketname = configur.get('s3', 'bucket_name')
-    
-    s3 = boto3.resource('s3')
-    bucket = s3.Bucket(bucketname)
-    
-    #
-    # configure for RDS access
-    #
-    rds_endpoint = configur.get('rds', 'endpoint')
-    rds_portnum = int(configur.get('rds', 'port_number'))
-    rds_username = configur.get('rds', 'user_name')
-    rds_pwd = configur.get('rds', 'user_pwd')
-    rds_dbname = configur.get('rds', 'db_name')
+###################################################################
+#
+# flush_prices
+#
+# Writes a batch of buffered price rows to the database in one
+# round trip / transaction. The INSERT is an upsert on (cardname,
+# pricedate), so writing a card twice for the same day replaces
+# its price instead of adding a duplicate row, and since each
+# batch commits as a unit, the rows in prices for a date are also
+# the checkpoint of which cards that day's run has finished.
+#
+def flush_prices(conn, sql, pending, batch_size):
+  """
+  Bulk-upserts buffered price rows
 
-    conn = datatier.get_dbConn(rds_endpoint, rds_portnum, rds_username, rds_pwd, rds_dbname)
-  
-    #need to check the cards table for what cards we should update
-    sql = "SELECT cardname FROM cards;"
-    rows = datatier.retrieve_all_rows(conn, sql)
+  Parameters
+  ----------
+  conn: database connection
+  sql: parameterized upsert into prices
+  pending: list of [setcode, price, cardname, pricedate, imagekey] rows
+  batch_size: max rows per INSERT / commit
+
+  Returns
+  -------
+  number of price rows written
+  """
+  print(f"Updating database with {len(pending)} prices...")
+
+  # NOTE: MySQL counts an upserted row as 1 if inserted, 2 if
+  # updated and 0 if unchanged, so the affected-row count can't be
+  # compared to len(pending); any failure raises instead.
+  datatier.perform_bulk_action(conn, sql, pending, batch_size)
+
+  print(f"Wrote {len(pending)} price entries to the database.")
+  return len(pending)
+
+
+###################################################################
+#
+# fetch_by_search
+#
+# Runs one Scryfall search per tracked card (batch_size cards at a
+# time, concurrently) and writes each card's cheapest printing.
+# Stops fetching at give_up_at, leaving the cards not yet fetched
+# as failed for a rerun to pick up.
+#
+def fetch_by_search(conn, names, insert_sql, pricedate, batch_size, max_concurrency, give_up_at=None):
+  """
+  Fetches and stores today's prices using the Scryfall search API
+
+  Parameters
+  ----------
+  conn: database connection
+  names: tracked card names
+  insert_sql: parameterized INSERT into prices
+  pricedate: date to record the prices under (YYYY-MM-DD)
+  batch_size: # of cards fetched / written at a time
+  max_concurrency: max # of Scryfall requests in flight at once
+  give_up_at: time.monotonic() after which no more Scryfall
+    requests are made (None for no limit)
+
+  Returns
+  -------
+  (number of price rows written, list of names whose fetch failed)
+  """
+  url = webservice.scryfall_url("/cards/search?q=%21%27")
+  footer = "%27+include%3Aextras+game%3Apaper+-is%3Amemorabilia&unique=prints"
 
+  rowsupdated = 0
+  failed = []
 
-    url = "https://api.scryfall.com/cards/search?q=%21%27"
-    footer = "%27+include%3Aextras+game%3Apaper+-is%3Amemorabilia&unique=prints"
+  # fetch batch_size cards' searches concurrently, then write
+  # that batch's prices before fetching the next one:
+  for first in range(0, len(names), batch_size):
+    deadline = None
+    if give_up_at is not None:
+      deadline = give_up_at - time.monotonic()
+      if deadline <= 0:
+        print(f"Out of time, leaving {len(names) - first} cards for a rerun")
+        failed.extend(names[first:])
+        break
 
-    rowsupdated = 0
-    for row in rows:
-      name = row[0]
-      print(name)
-      query = url + name + footer
-      res = webservice.web_service_get(query)
-      body = json.loads(res.data)
+    batch = names[first:first + batch_size]
+    queries = [url + name + footer for name in batch]
+
+    responses, latencies = webservice.web_service_get_many(queries, max_concurrency, deadline)
+
+    pending = []
+    for name, res, latency in zip(batch, responses, latencies):
+      print(f"{name} ({latency:.3f}s)")
+
+      # a card that fails is skipped, not fatal: the rest of the
+      # run still gets written, and a rerun picks up just the
+      # cards that are missing
+      if res is None:
+        print(f"Scryfall request for {name} failed with no response, skipping")
+        failed.append(name)
+        continue
 
       # let's look at what we got back:
       if res.status == 200: #success
-        pass
+        body = json.loads(res.data)
       else:
         # failed:
         print("Failed with status code:", res.status)
         print("url: " + url)
-        if res.status == 500:
+        if res.status >= 400:
           # we'll have an error message
-          print("Error message:", body)
+          print("Error message:", res.data)
         #
-        raise Exception("Scryfall request failed with error: ", body)
+        failed.append(name)
+        continue
 
       # deserialize and extract prices:
       b_price = 10000
@@ -100,20 +144,167 @@ def lambda_handler(event, context):
           b_set = row["set"]
 
       print(f"The best printing for {name} is in {b_set} at ${b_price}")
-      print("Updating database...")
 
       # date code from https://stackoverflow.com/questions/32490629/getting-todays-date-in-yyyy-mm-dd-in-python
       # datetime.today().strftime('%Y-%m-%d')
 
-      sql = f"""INSERT INTO prices(setcode, price, cardname, pricedate, imagekey)
-                values('{b_set}', {b_price}, '{name}', '{date.today().strftime('%Y-%m-%d')}', '---')"""
-      
-      num = datatier.perform_action(conn, sql)
-      if num != 1:
-        raise Exception(f"Failed to insert into database. Affected {num} rows.")
-      else:
-        print(f"Added {name}'s entry to the database.")
-        rowsupdated += 1
+      pending.append([b_set, b_price, name, pricedate, '---'])
+
+    if len(latencies) > 0:
+      print(f"Fetched {len(batch)} searches, avg {sum(latencies) / len(latencies):.3f}s, max {max(latencies):.3f}s")
+
+    if len(pending) > 0:
+      rowsupdated += flush_prices(conn, insert_sql, pending, batch_size)
+
+  return (rowsupdated, failed)
+
+
+###################################################################
+#
+# fetch_by_bulk
+#
+# Streams a Scryfall bulk-data file once, keeping only the tracked
+# cards' cheapest printings, then bulk-writes them. Memory is
+# bounded by the parser's buffer plus one entry per tracked card.
+#
+def fetch_by_bulk(conn, names, source, insert_sql, pricedate, batch_size):
+  """
+  Fetches and stores today's prices from a Scryfall bulk-data file
+
+  Parameters
+  ----------
+  conn: database connection
+  names: tracked card names
+  source: local path or url of the bulk-data file; "" to download
+    the current default_cards file
+  insert_sql: parameterized INSERT into prices
+  pricedate: date to record the prices under (YYYY-MM-DD)
+  batch_size: max rows per INSERT / commit
+
+  Returns
+  -------
+  (number of price rows written, list of names whose fetch failed,
+  which is always empty: a name with no priced printing in the
+  file is skipped, not failed, since rerunning won't change that)
+  """
+  if source == "":
+    source = bulkdata.default_cards_uri()
+
+  print(f"Reading bulk data from {source}...")
+
+  stream = bulkdata.open_source(source)
+  try:
+    best = bulkdata.cheapest_printings(bulkdata.iter_json_array(stream), set(names))
+  finally:
+    stream.close()
+
+  pending = []
+  for name in names:
+    if name not in best:
+      print(f"No USD price found for {name}, skipping")
+      continue
+
+    b_price, b_set = best[name]
+    print(f"The best printing for {name} is in {b_set} at ${b_price}")
+    pending.append([b_set, b_price, name, pricedate, '---'])
+
+  if len(pending) == 0:
+    return (0, [])
+
+  return (flush_prices(conn, insert_sql, pending, batch_size), [])
+
+
+@bootstrap.cold_start_report
+@querystats.instrumented
+def lambda_handler(event, context):
+  try:
+    print("**STARTING**")
+    print("**fetching fetchland info...**")
+    
+    #
+    # config is parsed once per container (see bootstrap.py):
+    #
+    configur = bootstrap.config()
+
+    conn = bootstrap.get_dbConn()
+
+    # cache, base url and rate limit from [scryfall]; a forced rerun
+    # is meant to refetch everything, so it goes without the cache:
+    bootstrap.configure_scryfall(cache=not event.get("force", False))
+
+    # price rows are buffered and written batch_size at a time:
+    batch_size = configur.getint('fetch', 'batch_size', fallback=500)
+
+    # max # of Scryfall requests in flight at once (the shared rate
+    # limiter in webservice still caps the overall request rate):
+    max_concurrency = configur.getint('fetch', 'max_concurrency', fallback=4)
+
+    # Scryfall requests (retries included) get whatever is left of
+    # this invocation's timeout, less reserve_seconds for writing the
+    # last batch and refreshing the price changes:
+    give_up_at = None
+    if hasattr(context, "get_remaining_time_in_millis"):
+      reserve = configur.getfloat('fetch', 'reserve_seconds', fallback=30.0)
+      give_up_at = time.monotonic() + context.get_remaining_time_in_millis() / 1000.0 - reserve
+  
+    #need to check the cards table for what cards we should update
+    sql = "SELECT cardname FROM cards;"
+    rows = datatier.retrieve_all_rows(conn, sql)
+
+
+    insert_sql = """INSERT INTO prices(setcode, price, cardname, pricedate, imagekey)
+                    values(%s, %s, %s, %s, %s)
+                    ON DUPLICATE KEY UPDATE setcode = VALUES(setcode), price = VALUES(price)"""
+
+    # a rerun of a failed / partial run can name the day it is
+    # finishing, otherwise this is today's run:
+    pricedate = event.get("pricedate", date.today().strftime('%Y-%m-%d'))
+
+    names = [row[0] for row in rows]
+
+    #
+    # checkpoint: cards that already have a price for this date were
+    # finished by an earlier (failed or partial) run today, so only
+    # fetch the rest, unless the event asks to refetch everything:
+    #
+    if not event.get("force", False):
+      sql = "SELECT cardname FROM prices WHERE pricedate = %s;"
+      done = set(row[0] for row in datatier.retrieve_all_rows(conn, sql, [pricedate]))
+
+      if len(done) > 0:
+        print(f"{len(done)} cards already have prices for {pricedate}, resuming with the rest")
+        names = [name for name in names if name not in done]
+
+    #
+    # "search" runs one Scryfall search per tracked card; "bulk"
+    # streams a Scryfall bulk-data file (local path or url; by
+    # default the current default_cards download) in one pass.
+    # The event can override the configured mode / bulk_source (not
+    # "source", which EventBridge events already use for "aws.events"):
+    #
+    mode = event.get("mode", configur.get('fetch', 'mode', fallback='search'))
+    source = event.get("bulk_source", configur.get('fetch', 'bulk_source', fallback=''))
+
+    if mode == "search":
+      rowsupdated, failed = fetch_by_search(conn, names, insert_sql, pricedate, batch_size, max_concurrency, give_up_at)
+    elif mode == "bulk":
+      rowsupdated, failed = fetch_by_bulk(conn, names, source, insert_sql, pricedate, batch_size)
+    else:
+      raise Exception(f"unknown fetch mode '{mode}', expected 'search' or 'bulk'")
+
+    print("Scryfall cache:", webservice.get_cache_stats())
+    print("Scryfall connections:", webservice.get_pool_stats())
+
+    # keep the precomputed 1/7/30/90/365 day changes current:
+    numrefreshed = pricechanges.refresh(conn, pricedate)
+    print(f"Refreshed price changes for {numrefreshed} cards.")
+
+    if len(failed) > 0:
+      print(f"Failed to fetch prices for {len(failed)} cards:", failed)
+      return {
+        'statusCode': 500,
+        'body': json.dumps(f"Added prices for {rowsupdated} cards, but {len(failed)} failed; rerun to fetch the rest: {failed}")
+      }
 
     return {
       'statusCode': 200,
@@ -5,59 +5,24 @@
 #
 
 import json
-import boto3
-import os
-import uuid
-import base64
-import pathlib
-import src.datatier as datatier
-import src.webservice as webservice
-import urllib.parse
-import string
+import bootstrap
+import datatier
+import pricechanges
+import querystats
 import datetime
 
-from configparser import ConfigParser
 
+@bootstrap.cold_start_report
+@querystats.instrumented
 def lambda_handler(event, context):
   try:
     print("**STARTING**")
     print("**finding the best fetchland...**")
-    
-    #
-    # setup AWS based on config file:
-    #
-    config_file = 'mtgpricetracker.ini'
-    os.environ['AWS_SHARED_CREDENTIALS_FILE'] = config_file
-    
-    configur = ConfigParser()
-    configur.read(config_file)
-    
-    #
-    # configure for S3 access:
-    #
-    s3_profile = 's3readwrite'
-    boto3.setup_default_session(profile_name=s3_profile)
-    
-    bucketname = configur.get('s3', 'bucket_name')
-    
-    s3 = boto3.resource('s3')
-    bucket = s3.Bucket(bucketname)
-    
-    #
-    # configure for RDS access
-    #
-    rds_endpoint = configur.get('rds', 'endpoint')
-    rds_portnum = int(configur.get('rds', 'port_number'))
-    rds_username = configur.get('rds', 'user_name')
-    rds_pwd = configur.get('rds', 'user_pwd')
-    rds_dbname = configur.get('rds', 'db_name')
-
-    conn = datatier.get_dbConn(rds_endpoint, rds_portnum, rds_username, rds_pwd, rds_dbname)
 
     # expecting the body of the request to have a num_days parameter
     if "numdays" in event:
       num_days = event["numdays"]
-    elif "pathParameters" in event:
+    elif "pathParameters" in event and event["pathParameters"] is not None:
       if "numdays" in event["pathParameters"]:
         num_days = event["pathParameters"]["numdays"]
       else:
@@ -79,29 +44,38 @@ def lambda_handler(event, context):
     if target_day < datetime.date(2025, 3, 9):
       raise Exception("Tracking started March 9th, 2025. Please select a smaller number of days.")
 
-    sql = f"""SELECT cardname, price, pricedate, setcode from prices WHERE pricedate = '{today.strftime('%Y-%m-%d')}'
-            OR pricedate = '{target_day.strftime('%Y-%m-%d')}' ORDER BY cardname, pricedate ASC"""
-
-    rows = datatier.retrieve_all_rows(conn, sql)
-
-    best_diff = 100
-    for i in range(len(rows)):
-        row = rows[i]
-        #print(row)
-        #going to be comparing backwards so can skip the first row
-        if i == 0:
-          continue
-
-        prev_row = rows[i-1]
-
-        # recall order is 0=name, 1=price, 2=date, 3=setcode
-        if row[0] == prev_row[0] and row[3] != prev_row[2]:
-          diff = row[1] - prev_row[1]
-          if diff < best_diff:
-            best_diff = diff
-            best_card = row[0]
-            best_price = row[1]
-            best_set = row[3]
+    # input is valid, so now it's worth a database connection:
+    conn = bootstrap.get_dbConn()
+
+    # the standard windows are precomputed by fetch_prices, so try
+    # those first:
+    row = ()
+    if num_days in pricechanges.WINDOWS:
+      row = pricechanges.best_drop(conn, num_days, today.strftime('%Y-%m-%d'))
+
+    # otherwise (an arbitrary window, or price_changes hasn't been
+    # refreshed for today yet) let the database compute every
+    # card's change between the two dates (a self-join on the
+    # (cardname, pricedate) key, driven by the pricedate index) and
+    # send back only the biggest drop:
+    if len(row) == 0:
+      sql = """SELECT t.cardname, ROUND(t.price - p.price, 2) AS diff, t.price, t.setcode
+               FROM prices t
+               JOIN prices p ON p.cardname = t.cardname AND p.pricedate = %s
+               WHERE t.pricedate = %s
+               ORDER BY diff ASC, t.cardname ASC
+               LIMIT 1;"""
+
+      row = datatier.retrieve_one_row(conn, sql, [target_day.strftime('%Y-%m-%d'), today.strftime('%Y-%m-%d')])
+
+    if len(row) == 0:
+      raise Exception(f"No cards have prices for both {target_day} and {today}.")
+
+    # recall order is 0=name, 1=diff, 2=price, 3=setcode
+    best_card = row[0]
+    best_diff = row[1]
+    best_price = row[2]
+    best_set = row[3]
 
     print(f"The card with the biggest price drop was {best_card} with a {str(best_diff)} change!")
     print(f"The best printing is {best_set} at ${best_price}.")
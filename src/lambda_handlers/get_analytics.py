@@ -0,0 +1,131 @@
+#
+# Python program to compute moving averages, volatility, drawdown and percent change for every tracked card
+#
+# Written by Jack Vogel using template code from Joe Hummel (Northwestern CS310)
+#
+
+import json
+import bootstrap
+import datatier
+import cardnames
+import querystats
+import analytics
+import datetime
+import math
+
+
+DEFAULT_DAYS = 365
+MAX_DAYS = 3 * 365
+MAX_WINDOW = 365
+MAX_CARDS = 200
+
+
+###################################################################
+#
+# _value
+#
+# JSON has no NaN; statistics a card doesn't have enough history
+# for come back as null.
+#
+def _value(x):
+  x = float(x)
+  return None if math.isnan(x) else round(x, 4)
+
+
+@bootstrap.cold_start_report
+@querystats.instrumented
+def lambda_handler(event, context):
+  try:
+    print("**STARTING**")
+    print("**computing price analytics...**")
+
+    #
+    # optional query strings: window (days, for the moving average,
+    # volatility and percent change), span (days, for the
+    # exponential moving average; defaults to window), from / to
+    # (YYYY-MM-DD) and cards (comma-separated names; default every
+    # tracked card)
+    #
+    params = event.get("queryStringParameters") or {}
+
+    window = int(params.get("window", 30))
+    if window < 2 or window > MAX_WINDOW:
+      raise Exception(f"window must be between 2 and {MAX_WINDOW}")
+    span = int(params.get("span", window))
+    if span < 1 or span > MAX_WINDOW:
+      raise Exception(f"span must be between 1 and {MAX_WINDOW}")
+
+    end = datetime.date.today()
+    if "to" in params:
+      end = datetime.date.fromisoformat(params["to"])
+    start = end - datetime.timedelta(days=DEFAULT_DAYS)
+    if "from" in params:
+      start = datetime.date.fromisoformat(params["from"])
+    if end < start:
+      raise Exception("to must not be before from")
+    if (end - start).days >= MAX_DAYS:
+      raise Exception(f"from and to can be at most {MAX_DAYS} days apart")
+
+    cards = []
+    if "cards" in params:
+      cards = cardnames.parse_list(params["cards"])
+      if len(cards) > MAX_CARDS:
+        raise Exception(f"at most {MAX_CARDS} cards can be requested at once")
+
+    conn = bootstrap.get_dbConn()
+
+    #
+    # the database does the date arithmetic and the grouping by card
+    # (see analytics.price_matrix), so each chunk of rows just gets
+    # split into columns:
+    #
+    sql = "SELECT cardname, DATEDIFF(pricedate, %s), price FROM prices WHERE pricedate BETWEEN %s AND %s"
+    sqlparams = [start.strftime('%Y-%m-%d'), start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d')]
+    if len(cards) > 0:
+      sql += f" AND cardname IN ({', '.join(['%s'] * len(cards))})"
+      sqlparams += cards
+    sql += " ORDER BY cardname, pricedate;"
+
+    names = []
+    offsets = []
+    prices = []
+    for rows in datatier.retrieve_row_chunks(conn, sql, sqlparams):
+      if len(rows) > 0:
+        chunk_names, chunk_offsets, chunk_prices = zip(*rows)
+        names.extend(chunk_names)
+        offsets.extend(chunk_offsets)
+        prices.extend(chunk_prices)
+
+    print(f"{len(prices)} price records found")
+
+    rownames, days, matrix = analytics.price_matrix(names, offsets, prices, start, end)
+    stats = analytics.summarize(matrix, window, span)
+
+    print(f"analytics computed for {len(rownames)} cards over {len(days)} days")
+
+    ret = {}
+    for i, name in enumerate(rownames):
+      ret[name] = {stat: _value(values[i]) for stat, values in stats.items()}
+
+    return {
+      'statusCode': 200,
+      'body': json.dumps({
+        "from": start.strftime('%Y-%m-%d'),
+        "to": end.strftime('%Y-%m-%d'),
+        "window": window,
+        "span": span,
+        "cards": ret
+      })
+    }
+  
+  #
+  # on an error, try to output error message:
+  #
+  except Exception as err:
+    print("**ERROR**")
+    print(str(err))
+
+    return {
+      'statusCode': 500,
+      'body': json.dumps(str(err))
+    }
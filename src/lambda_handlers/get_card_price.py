@@ -6,89 +6,84 @@
 #
 
 import json
-import boto3
-import os
-import uuid
-import base64
-import pathlib
+import bootstrap
 import datatier
-import webservice
-import urllib.parse
-import string
+import cardnames
+import pricecache
+import querystats
 import datetime
 
-from configparser import ConfigParser
 
+@bootstrap.cold_start_report
+@querystats.instrumented
 def lambda_handler(event, context):
   try:
     print("**STARTING**")
     print("**fetching card price info...**")
-    
-    #
-    # setup AWS based on config file:
-    #
-    config_file = 'mtgpricetracker.ini'
-    os.environ['AWS_SHARED_CREDENTIALS_FILE'] = config_file
-    
-    configur = ConfigParser()
-    configur.read(config_file)
-    
-    #
-    # configure for S3 access:
-    #
-    s3_profile = 's3readwrite'
-    boto3.setup_default_session(profile_name=s3_profile)
-    
-    bucketname = configur.get('s3', 'bucket_name')
-    
-    s3 = boto3.resource('s3')
-    bucket = s3.Bucket(bucketname)
-    
-    #
-    # configure for RDS access
-    #
-    rds_endpoint = configur.get('rds', 'endpoint')
-    rds_portnum = int(configur.get('rds', 'port_number'))
-    rds_username = configur.get('rds', 'user_name')
-    rds_pwd = configur.get('rds', 'user_pwd')
-    rds_dbname = configur.get('rds', 'db_name')
-
-    conn = datatier.get_dbConn(rds_endpoint, rds_portnum, rds_username, rds_pwd, rds_dbname)
 
     # get cardname and optional date
     if "cardname" in event:
       cardname = event["cardname"]
-    elif "pathParameters" in event:
+    elif "pathParameters" in event and event["pathParameters"] is not None:
       if "cardname" in event["pathParameters"]:
         cardname = event["pathParameters"]["cardname"]
       else:
         raise Exception("requires cardname parameter in pathParameters")
     else:
         raise Exception("requires cardname parameter in event")
+
+    # names are stored with + in place of spaces:
+    cardname = cardnames.normalize(cardname)
     
     date = datetime.date.today().strftime('%Y-%m-%d')
-    if "queryStringParameters" in event:
+    if event.get("queryStringParameters"):
         if "date" in event["queryStringParameters"]:
             date = event["queryStringParameters"]["date"]
+            # normalizes the date, and raises if it isn't YYYY-MM-DD
+            date = datetime.date.fromisoformat(date).strftime('%Y-%m-%d')
         else:
             raise Exception("date is the only expected query parameter")
 
-  
-    #need to check the cards table to see if we're tracking this
-    sql1 = f"SELECT * FROM cards WHERE cardname='{cardname}';"
-    rows = datatier.retrieve_all_rows(conn, sql1)
-    if len(rows) == 0:
+    # warm containers answer repeat lookups without the database:
+    cached = pricecache.get(cardname, date)
+    if cached is not None:
+      return {
+        'statusCode': 200,
+        'body': json.dumps({"price": cached[0], "date": cached[1]})
+      }
+
+    conn = bootstrap.get_dbConn()
+
+    # one round trip: whether we track the card, its most recent
+    # price on or before the date (via the (cardname, pricedate)
+    # key), and the newest pricedate overall for the cache
+    sql = """SELECT c.cardname, p.price, p.pricedate, (SELECT MAX(pricedate) FROM prices)
+             FROM cards c
+             LEFT JOIN prices p
+               ON p.cardname = c.cardname
+              AND p.pricedate = (SELECT MAX(pricedate) FROM prices
+                                 WHERE cardname = c.cardname AND pricedate <= %s)
+             WHERE c.cardname = %s
+             LIMIT 1;"""
+
+    row = datatier.retrieve_one_row(conn, sql, [date, cardname])
+
+    if len(row) == 0:
         raise Exception("This card's price is not being tracked")
 
-    sql2 = f"SELECT price FROM prices WHERE cardname='{cardname}' AND pricedate='{date}';"
-    rows = datatier.retrieve_all_rows(conn, sql2)
+    if row[3] is not None:
+      pricecache.note_latest(row[3].strftime('%Y-%m-%d'))
+
+    if row[1] is None:
+        raise Exception("There's no price record on or before that date.")
 
-    if len(rows) == 0:
-        raise Exception("There's no price record for that date.")
+    price = row[1]
+    pricedate = row[2].strftime('%Y-%m-%d')
+    pricecache.put(cardname, date, price, pricedate)
        
     return {
       'statusCode': 200,
-      'body': json.dumps({"price": rows[0][0]})
+      'body': json.dumps({"price": price, "date": pricedate})
     }
   
   #
@@ -0,0 +1,115 @@
+#
+# Python program to get the prices of a list of cards in one request
+#
+# Written by Jack Vogel using template code from Joe Hummel (Northwestern CS310)
+#
+
+import json
+import bootstrap
+import datatier
+import cardnames
+import pricecache
+import querystats
+import datetime
+
+
+MAX_CARDS = 300
+
+
+@bootstrap.cold_start_report
+@querystats.instrumented
+def lambda_handler(event, context):
+  try:
+    print("**STARTING**")
+    print("**fetching card prices...**")
+
+    # expecting the request body to have a list of card names and
+    # an optional date
+    if "body" in event:
+      body = json.loads(event["body"])
+      if "cards" in body:
+        cards = body["cards"]
+      else:
+        raise Exception("requires cards parameter in request body")
+    else:
+      raise Exception("requires body with data")
+
+    if type(cards) is not list or len(cards) == 0 or len(cards) > MAX_CARDS:
+      raise Exception(f"cards must be a list of between 1 and {MAX_CARDS} card names")
+
+    date = datetime.date.today().strftime('%Y-%m-%d')
+    if "date" in body:
+      # normalizes the date, and raises if it isn't YYYY-MM-DD
+      date = datetime.date.fromisoformat(body["date"]).strftime('%Y-%m-%d')
+
+    # names are stored with + in place of spaces; remember what the
+    # caller called each card so the response uses their names
+    requested = {}
+    for card in cards:
+      if type(card) is not str:
+        raise Exception("cards must be a list of card names")
+      requested.setdefault(cardnames.normalize(card), []).append(card)
+
+    # results are keyed by lowercased name: MySQL compares names
+    # case-insensitively, so the rows can come back cased differently
+    # from how the cards were asked for
+    results = {}
+    missing = []
+    for name in requested:
+      cached = pricecache.get(name, date)
+      if cached is None:
+        missing.append(name)
+      else:
+        results[name.lower()] = {"price": cached[0], "date": cached[1]}
+
+    print(f"{len(requested) - len(missing)} of {len(requested)} prices cached")
+
+    if len(missing) > 0:
+      conn = bootstrap.get_dbConn()
+
+      # one round trip for every card not in the cache: whether we
+      # track it, its most recent price on or before the date (via
+      # the (cardname, pricedate) key), and the newest pricedate
+      sql = f"""SELECT c.cardname, p.price, p.pricedate, (SELECT MAX(pricedate) FROM prices)
+                FROM cards c
+                LEFT JOIN prices p
+                  ON p.cardname = c.cardname
+                 AND p.pricedate = (SELECT MAX(pricedate) FROM prices
+                                    WHERE cardname = c.cardname AND pricedate <= %s)
+                WHERE c.cardname IN ({', '.join(['%s'] * len(missing))});"""
+
+      rows = datatier.retrieve_all_rows(conn, sql, [date] + missing)
+
+      for row in rows:
+        if row[3] is not None:
+          pricecache.note_latest(row[3].strftime('%Y-%m-%d'))
+
+        if row[1] is None:
+          results[row[0].lower()] = {"price": None, "error": "There's no price record on or before that date."}
+        else:
+          pricedate = row[2].strftime('%Y-%m-%d')
+          results[row[0].lower()] = {"price": row[1], "date": pricedate}
+          pricecache.put(row[0], date, row[1], pricedate)
+
+    ret = {}
+    for name, originals in requested.items():
+      result = results.get(name.lower(), {"price": None, "error": "This card's price is not being tracked"})
+      for original in originals:
+        ret[original] = result
+
+    return {
+      'statusCode': 200,
+      'body': json.dumps({"date": date, "prices": ret})
+    }
+  
+  #
+  # on an error, try to output error message:
+  #
+  except Exception as err:
+    print("**ERROR**")
+    print(str(err))
+
+    return {
+      'statusCode': 500,
+      'body': json.dumps(str(err))
+    }
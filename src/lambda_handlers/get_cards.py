@@ -5,18 +5,12 @@
 #
 
 import json
-import boto3
-import os
-import uuid
-import base64
-import pathlib
+import bootstrap
 import datatier
-import webservice
-import urllib.parse
-import string
+import querystats
+import responseformat
 import datetime
 
-from configparser import ConfigParser
 
 ############################################################
 #
@@ -29,41 +23,14 @@ class Card:
     self.name = row[1]
     self.date = row[2]
 
+@bootstrap.cold_start_report
+@querystats.instrumented
 def lambda_handler(event, context):
   try:
     print("**STARTING**")
     print("**getting cards...**")
-    
-    #
-    # setup AWS based on config file:
-    #
-    config_file = 'mtgpricetracker.ini'
-    os.environ['AWS_SHARED_CREDENTIALS_FILE'] = config_file
-    
-    configur = ConfigParser()
-    configur.read(config_file)
-    
-    #
-    # configure for S3 access:
-    #
-    s3_profile = 's3readwrite'
-    boto3.setup_default_session(profile_name=s3_profile)
-    
-    bucketname = configur.get('s3', 'bucket_name')
-    
-    s3 = boto3.resource('s3')
-    bucket = s3.Bucket(bucketname)
-    
-    #
-    # configure for RDS access
-    #
-    rds_endpoint = configur.get('rds', 'endpoint')
-    rds_portnum = int(configur.get('rds', 'port_number'))
-    rds_username = configur.get('rds', 'user_name')
-    rds_pwd = configur.get('rds', 'user_pwd')
-    rds_dbname = configur.get('rds', 'db_name')
 
-    conn = datatier.get_dbConn(rds_endpoint, rds_portnum, rds_username, rds_pwd, rds_dbname)
+    conn = bootstrap.get_dbConn()
   
     # example sql
     sql1 = f"SELECT * FROM cards;"
@@ -80,15 +47,17 @@ def lambda_handler(event, context):
     else:
       print(f"{len(cards)} cards found!")
 
-    ret = []
-    for card in cards:
-      temp = {"cardid": card.cardid, "name": card.name, "date": card.date.strftime('%Y-%m-%d')}
-      ret.append(temp)
+    if responseformat.wants_columnar(event):
+      records = [(card.cardid, card.name, card.date.strftime('%Y-%m-%d')) for card in cards]
+      body = json.dumps(responseformat.columnar(records, ("cardid", "name", "date"), dict_fields=("date",)))
+    else:
+      ret = []
+      for card in cards:
+        temp = {"cardid": card.cardid, "name": card.name, "date": card.date.strftime('%Y-%m-%d')}
+        ret.append(temp)
+      body = json.dumps(ret)
    
-    return {
-      'statusCode': 200,
-      'body': json.dumps(ret)
-    }
+    return responseformat.make_response(event, body)
   
   #
   # on an error, try to output error message:
@@ -0,0 +1,222 @@
+#
+# Python program to find the cards with the biggest price drops and gains over a window
+#
+# Written by Jack Vogel using template code from Joe Hummel (Northwestern CS310)
+#
+
+import json
+import heapq
+import bootstrap
+import datatier
+import cardnames
+import pricechanges
+import querystats
+import datetime
+
+
+MAX_K = 100
+MAX_CARDS = 200
+
+
+###################################################################
+#
+# top_movers
+#
+# Single pass over (cardname, diff, price, setcode, prevprice) rows
+# keeping two bounded heaps, so memory is O(k) however many cards
+# there are: `gains` is a min-heap of the k largest scores seen so
+# far, `drops` a min-heap of the k largest negated scores (i.e. the
+# k smallest scores).
+#
+def top_movers(rows, k, metric):
+  """
+  Selects the k biggest drops and k biggest gains
+
+  Parameters
+  ----------
+  rows: iterable of (cardname, diff, price, setcode, prevprice),
+  k: # of cards to return in each direction,
+  metric: "abs" to rank by dollar change, "pct" by percent change
+
+  Returns
+  -------
+  (drops, gains, count): lists of dicts, biggest mover first, and
+  the # of rows considered
+  """
+  drops = []
+  gains = []
+  count = 0
+
+  for row in rows:
+    name, diff, price, setcode, prevprice = row
+    if diff is None or prevprice is None:
+      continue
+
+    pct = None
+    if prevprice > 0:
+      pct = round(diff / prevprice * 100.0, 2)
+
+    if metric == "pct":
+      if pct is None:
+        continue
+      score = pct
+    else:
+      score = diff
+
+    count += 1
+    mover = {"cardname": name, "diff": diff, "pct": pct, "price": price, "prevprice": prevprice, "setcode": setcode}
+
+    if len(gains) < k:
+      heapq.heappush(gains, (score, name, mover))
+    elif (score, name) > gains[0][:2]:
+      heapq.heapreplace(gains, (score, name, mover))
+
+    if len(drops) < k:
+      heapq.heappush(drops, (-score, name, mover))
+    elif (-score, name) > drops[0][:2]:
+      heapq.heapreplace(drops, (-score, name, mover))
+
+  drops = [entry[2] for entry in sorted(drops, reverse=True)]
+  gains = [entry[2] for entry in sorted(gains, reverse=True)]
+
+  # a card that went up can't be a "drop" and vice versa:
+  key = "pct" if metric == "pct" else "diff"
+  drops = [m for m in drops if m[key] < 0]
+  gains = [m for m in gains if m[key] > 0]
+
+  return (drops, gains, count)
+
+
+###################################################################
+#
+# filters_sql
+#
+# Builds the WHERE clause additions (and their parameters) for the
+# optional filters; `alias` is the table holding the current price.
+#
+def filters_sql(alias, setcode, minprice, maxprice, cards):
+  clauses = ""
+  params = []
+
+  if setcode is not None:
+    clauses += f" AND {alias}.setcode = %s"
+    params.append(setcode)
+  if minprice is not None:
+    clauses += f" AND {alias}.price >= %s"
+    params.append(minprice)
+  if maxprice is not None:
+    clauses += f" AND {alias}.price <= %s"
+    params.append(maxprice)
+  if cards is not None:
+    clauses += f" AND {alias}.cardname IN ({', '.join(['%s'] * len(cards))})"
+    params.extend(cards)
+
+  return (clauses, params)
+
+
+@bootstrap.cold_start_report
+@querystats.instrumented
+def lambda_handler(event, context):
+  try:
+    print("**STARTING**")
+    print("**finding the biggest movers...**")
+
+    # numdays comes from the path, like /pricedrop/{numdays}
+    if "numdays" in event:
+      num_days = event["numdays"]
+    elif "pathParameters" in event and event["pathParameters"] is not None:
+      if "numdays" in event["pathParameters"]:
+        num_days = event["pathParameters"]["numdays"]
+      else:
+        raise Exception("requires numdays parameter in pathParameters")
+    else:
+        raise Exception("requires numdays parameter in event")
+
+    if type(num_days) is not int:
+        num_days = int(num_days)
+        # this will raise an error if it's not an int-like string
+
+    # optional query string parameters:
+    #   k=10, metric=abs|pct, set=<setcode>, minprice=, maxprice=,
+    #   cards=<name>,<name>,...
+    params = event.get("queryStringParameters") or {}
+
+    k = int(params.get("k", 10))
+    if k < 1 or k > MAX_K:
+      raise Exception(f"k must be between 1 and {MAX_K}")
+
+    metric = params.get("metric", "abs")
+    if metric not in ("abs", "pct"):
+      raise Exception("metric must be 'abs' or 'pct'")
+
+    setcode = params.get("set")
+    minprice = float(params["minprice"]) if "minprice" in params else None
+    maxprice = float(params["maxprice"]) if "maxprice" in params else None
+
+    cards = None
+    if "cards" in params:
+      # names are stored with + in place of spaces
+      cards = cardnames.parse_list(params["cards"])
+      if len(cards) == 0 or len(cards) > MAX_CARDS:
+        raise Exception(f"cards must list between 1 and {MAX_CARDS} names")
+
+    today = datetime.date.today()
+    # the prices are fetched at 3am Central so we will update based on yesterday's if it's 4am or earlier
+    if datetime.datetime.now().hour < 9:
+      today = today - datetime.timedelta(days=1)
+
+    target_day = today - datetime.timedelta(days=num_days)
+
+    if target_day < datetime.date(2025, 3, 9):
+      raise Exception("Tracking started March 9th, 2025. Please select a smaller number of days.")
+
+    # input is valid, so now it's worth a database connection:
+    conn = bootstrap.get_dbConn()
+
+    # standard windows are precomputed by fetch_prices, once it has
+    # refreshed them for today:
+    if pricechanges.is_refreshed(conn, num_days, today.strftime('%Y-%m-%d')):
+      clauses, fparams = filters_sql("c", setcode, minprice, maxprice, cards)
+      sql = f"""SELECT c.cardname, c.diff, c.price, c.setcode, c.prevprice
+                FROM price_changes c
+                WHERE c.windowdays = %s AND c.asofdate = %s AND c.diff IS NOT NULL{clauses};"""
+
+      rows = (row for chunk in datatier.retrieve_row_chunks(conn, sql, [num_days, today.strftime('%Y-%m-%d')] + fparams) for row in chunk)
+      drops, gains, count = top_movers(rows, k, metric)
+
+    # arbitrary window (or price_changes not refreshed yet), compute
+    # the changes from the raw prices:
+    else:
+      clauses, fparams = filters_sql("t", setcode, minprice, maxprice, cards)
+      sql = f"""SELECT t.cardname, ROUND(t.price - p.price, 2), t.price, t.setcode, p.price
+                FROM prices t
+                JOIN prices p ON p.cardname = t.cardname AND p.pricedate = %s
+                WHERE t.pricedate = %s{clauses};"""
+
+      rows = (row for chunk in datatier.retrieve_row_chunks(conn, sql, [target_day.strftime('%Y-%m-%d'), today.strftime('%Y-%m-%d')] + fparams) for row in chunk)
+      drops, gains, count = top_movers(rows, k, metric)
+
+    print(f"Ranked {count} cards, returning {len(drops)} drops and {len(gains)} gains.")
+
+    return {
+      'statusCode': 200,
+      'body': json.dumps({
+        'numdays': num_days,
+        'asof': today.strftime('%Y-%m-%d'),
+        'metric': metric,
+        'drops': drops,
+        'gains': gains
+      })
+    }
+  
+  #
+  # on an error, output error message:
+  #
+  except Exception as err:
+    print("**ERROR**")
+    print(str(err))
+
+    return {
+      'statusCode': 500,
+      'body': json.dumps(str(err))
+    }
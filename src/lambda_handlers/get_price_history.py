@@ -0,0 +1,160 @@
+#
+# Python program to get the price history of one or more cards, optionally downsampled
+#
+# Written by Jack Vogel using template code from Joe Hummel (Northwestern CS310)
+#
+
+import json
+import bootstrap
+import datatier
+import cardnames
+import querystats
+import timeseries
+import datetime
+import numpy as np
+
+
+MAX_CARDS = 50
+
+TRACKING_START = datetime.date(2025, 3, 9)
+
+
+@bootstrap.cold_start_report
+@querystats.instrumented
+def lambda_handler(event, context):
+  try:
+    print("**STARTING**")
+    print("**getting price history...**")
+
+    #
+    # one card from the path (/history/{cardname}) and/or a list in
+    # the query string (?cards=<name>,<name>,...), plus optional
+    # from / to dates (YYYY-MM-DD) and interval (daily, weekly or
+    # monthly)
+    #
+    params = event.get("queryStringParameters") or {}
+
+    cards = []
+    if "cardname" in event:
+      cards.append(event["cardname"])
+    elif event.get("pathParameters") and "cardname" in event["pathParameters"]:
+      cards.append(event["pathParameters"]["cardname"])
+    if "cards" in params:
+      cards.extend(name for name in params["cards"].split(",") if name.strip() != "")
+
+    if len(cards) == 0:
+      raise Exception("requires a cardname parameter or a cards query parameter")
+    if len(cards) > MAX_CARDS:
+      raise Exception(f"at most {MAX_CARDS} cards can be requested at once")
+
+    # names are stored with + in place of spaces; remember what the
+    # caller called each card so the response uses their names
+    requested = {}
+    for card in cards:
+      requested.setdefault(cardnames.normalize(card), card)
+
+    start = TRACKING_START
+    if "from" in params:
+      start = datetime.date.fromisoformat(params["from"])
+    end = datetime.date.today()
+    if "to" in params:
+      end = datetime.date.fromisoformat(params["to"])
+    if end < start:
+      raise Exception("to must not be before from")
+
+    interval = params.get("interval", "daily")
+    if interval not in timeseries.INTERVALS:
+      raise Exception(f"interval must be one of {', '.join(timeseries.INTERVALS)}")
+
+    conn = bootstrap.get_dbConn()
+
+    # an index range scan on (cardname, pricedate) per card:
+    names = list(requested.keys())
+    sql = f"""SELECT cardname, pricedate, price, setcode FROM prices
+              WHERE cardname IN ({', '.join(['%s'] * len(names))})
+                AND pricedate BETWEEN %s AND %s
+              ORDER BY cardname, pricedate;"""
+
+    sqlparams = names + [start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d')]
+
+    series_names = []
+    series_ids = []
+    dates = []
+    prices = []
+    sets = []
+    for rows in datatier.retrieve_row_chunks(conn, sql, sqlparams):
+      for row in rows:
+        if len(series_names) == 0 or series_names[-1] != row[0]:
+          series_names.append(row[0])
+        series_ids.append(len(series_names) - 1)
+        dates.append(row[1])
+        prices.append(row[2])
+        sets.append(row[3])
+
+    print(f"{len(prices)} price records found for {len(series_names)} cards")
+
+    ret = {}
+    for name, original in requested.items():
+      ret[original] = {"date": []}
+
+    # MySQL compares names case-insensitively, so a card can come back
+    # cased differently from how it was asked for (?cards=arid mesa):
+    originals = {}
+    for name, original in requested.items():
+      originals.setdefault(name.lower(), original)
+
+    if interval == "daily":
+      # nothing to aggregate, just split the rows up by card:
+      date_strings = np.datetime_as_string(np.array(dates, dtype="datetime64[D]"))
+      first = 0
+      ids = np.array(series_ids, dtype="int64")
+      for i, name in enumerate(series_names):
+        last = int(np.searchsorted(ids, i, side="right"))
+        ret[originals[name.lower()]] = {
+          "date": date_strings[first:last].tolist(),
+          "price": prices[first:last],
+          "set": sets[first:last]
+        }
+        first = last
+    else:
+      buckets = timeseries.ohlc(np.array(series_ids, dtype="int64"),
+                                np.array(dates, dtype="datetime64[D]"),
+                                np.array(prices, dtype="float64"),
+                                interval)
+
+      bucket_dates = np.datetime_as_string(buckets["date"])
+      ids = buckets["series"]
+      first = 0
+      for i, name in enumerate(series_names):
+        last = int(np.searchsorted(ids, i, side="right"))
+        ret[originals[name.lower()]] = {
+          "date": bucket_dates[first:last].tolist(),
+          "open": buckets["open"][first:last].tolist(),
+          "high": buckets["high"][first:last].tolist(),
+          "low": buckets["low"][first:last].tolist(),
+          "close": buckets["close"][first:last].tolist(),
+          "count": buckets["count"][first:last].tolist()
+        }
+        first = last
+
+    return {
+      'statusCode': 200,
+      'body': json.dumps({
+        "from": start.strftime('%Y-%m-%d'),
+        "to": end.strftime('%Y-%m-%d'),
+        "interval": interval,
+        "series": ret
+      })
+    }
+  
+  #
+  # on an error, try to output error message:
+  #
+  except Exception as err:
+    print("**ERROR**")
+    print(str(err))
+
+    return {
+      'statusCode': 500,
+      'body': json.dumps(str(err))
+    }
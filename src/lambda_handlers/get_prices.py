@@ -5,18 +5,20 @@
 #
 
 import json
-import boto3
-import os
-import uuid
-import base64
-import pathlib
+import io
+import bootstrap
 import datatier
-import webservice
-import urllib.parse
-import string
+import cardnames
+import querystats
+import responseformat
 import datetime
 
-from configparser import ConfigParser
+
+DEFAULT_PAGE_SIZE = 1000
+MAX_PAGE_SIZE = 5000
+
+PRICE_FIELDS = ("priceid", "set", "price", "name", "date")
+
 
 ############################################################
 #
@@ -31,65 +33,93 @@ class Price:
     self.name = row[3]
     self.date = row[4]
 
+@bootstrap.cold_start_report
+@querystats.instrumented
 def lambda_handler(event, context):
   try:
     print("**STARTING**")
     print("**getting prices...**")
-    
-    #
-    # setup AWS based on config file:
-    #
-    config_file = 'mtgpricetracker.ini'
-    os.environ['AWS_SHARED_CREDENTIALS_FILE'] = config_file
-    
-    configur = ConfigParser()
-    configur.read(config_file)
-    
-    #
-    # configure for S3 access:
-    #
-    s3_profile = 's3readwrite'
-    boto3.setup_default_session(profile_name=s3_profile)
-    
-    bucketname = configur.get('s3', 'bucket_name')
-    
-    s3 = boto3.resource('s3')
-    bucket = s3.Bucket(bucketname)
-    
+
+    conn = bootstrap.get_dbConn()
+  
     #
-    # configure for RDS access
+    # optional query string parameters:
+    #   limit=<page size>, after=<priceid cursor from the previous
+    #   page>, cardname=, set=, from=YYYY-MM-DD, to=YYYY-MM-DD
     #
-    rds_endpoint = configur.get('rds', 'endpoint')
-    rds_portnum = int(configur.get('rds', 'port_number'))
-    rds_username = configur.get('rds', 'user_name')
-    rds_pwd = configur.get('rds', 'user_pwd')
-    rds_dbname = configur.get('rds', 'db_name')
+    params = event.get("queryStringParameters") or {}
 
-    conn = datatier.get_dbConn(rds_endpoint, rds_portnum, rds_username, rds_pwd, rds_dbname)
-  
-    # example sql
-    sql = f"SELECT * FROM prices;"
-    rows = datatier.retrieve_all_rows(conn, sql)
+    limit = int(params.get("limit", DEFAULT_PAGE_SIZE))
+    if limit < 1 or limit > MAX_PAGE_SIZE:
+      raise Exception(f"limit must be between 1 and {MAX_PAGE_SIZE}")
 
-    prices = []
-    for row in rows:
-      prices.append(Price(row))
+    after = int(params.get("after", 0))
 
-    if len(prices) == 0:
-      print("no price records...")
-      return
+    # keyset pagination: each page picks up after the last priceid
+    # of the previous one, so every page is an index range scan no
+    # matter how deep into the table it is (unlike OFFSET)
+    sql = "SELECT priceid, setcode, price, cardname, pricedate FROM prices WHERE priceid > %s"
+    sqlparams = [after]
+
+    if "cardname" in params:
+      sql += " AND cardname = %s"
+      sqlparams.append(cardnames.normalize(params["cardname"]))  # names are stored with + in place of spaces
+    if "set" in params:
+      sql += " AND setcode = %s"
+      sqlparams.append(params["set"])
+    if "from" in params:
+      sql += " AND pricedate >= %s"
+      sqlparams.append(datetime.date.fromisoformat(params["from"]).strftime('%Y-%m-%d'))
+    if "to" in params:
+      sql += " AND pricedate <= %s"
+      sqlparams.append(datetime.date.fromisoformat(params["to"]).strftime('%Y-%m-%d'))
+
+    # one extra row tells us whether there is another page:
+    sql += " ORDER BY priceid ASC LIMIT %s;"
+    sqlparams.append(limit + 1)
+
+    columnar = responseformat.wants_columnar(event)
+
+    # stream the page a chunk at a time and encode each row as it
+    # arrives, rather than materializing every row (and then every
+    # row again as a dict) before serializing. The columnar format
+    # has to see every row before it can write any column, so that
+    # path collects the (at most limit) records first:
+    body = io.StringIO()
+    body.write('{"prices": [')
+    records = []
+
+    count = 0
+    last_priceid = None
+    more = False
+    for rows in datatier.retrieve_row_chunks(conn, sql, sqlparams):
+      for row in rows:
+        if count == limit:
+          more = True
+          continue  # keep draining, the cursor has to be exhausted
+        price = Price(row)
+        if columnar:
+          records.append((price.priceid, price.set, price.price, price.name, price.date.strftime('%Y-%m-%d')))
+        else:
+          if count > 0:
+            body.write(", ")
+          body.write(json.dumps({"priceid": price.priceid, "set": price.set, "price": price.price, "name": price.name, "date": price.date.strftime('%Y-%m-%d')}))
+        last_priceid = price.priceid
+        count += 1
+
+    next_cursor = last_priceid if more else None
+
+    if columnar:
+      ret = responseformat.columnar(records, PRICE_FIELDS, dict_fields=("set", "name", "date"))
+      ret["next"] = next_cursor
+      body = json.dumps(ret)
     else:
-      print(f"{len(prices)} price records found!")
+      body.write(f'], "next": {json.dumps(next_cursor)}}}')
+      body = body.getvalue()
 
-    ret = []
-    for price in prices:
-      temp = {"priceid": price.priceid, "set": price.set, "price": price.price, "name": price.name, "date": price.date.strftime('%Y-%m-%d')}
-      ret.append(temp)
-   
-    return {
-      'statusCode': 200,
-      'body': json.dumps(ret)
-    }
+    print(f"{count} price records found!")
+
+    return responseformat.make_response(event, body)
   
   #
   # on an error, try to output error message:
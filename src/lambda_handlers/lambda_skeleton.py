@@ -5,54 +5,25 @@
 #
 
 import json
-import boto3
-import os
-import uuid
-import base64
-import pathlib
+import bootstrap
 import datatier
+import querystats
 import webservice
-import urllib.parse
-import string
 import datetime
 
-from configparser import ConfigParser
 
+@bootstrap.cold_start_report
+@querystats.instrumented
 def lambda_handler(event, context):
   try:
     print("**STARTING**")
     print("**[doing task]...**")
-    
-    #
-    # setup AWS based on config file:
-    #
-    config_file = 'mtgpricetracker.ini'
-    os.environ['AWS_SHARED_CREDENTIALS_FILE'] = config_file
-    
-    configur = ConfigParser()
-    configur.read(config_file)
-    
-    #
-    # configure for S3 access:
-    #
-    s3_profile = 's3readwrite'
-    boto3.setup_default_session(profile_name=s3_profile)
-    
-    bucketname = configur.get('s3', 'bucket_name')
-    
-    s3 = boto3.resource('s3')
-    bucket = s3.Bucket(bucketname)
-    
+
     #
-    # configure for RDS access
+    # config is parsed once per container (see bootstrap.py), e.g.
+    # configur = bootstrap.config(); if the task needs AWS, ask for a
+    # client only when it's used, e.g. s3 = bootstrap.aws_client('s3')
     #
-    rds_endpoint = configur.get('rds', 'endpoint')
-    rds_portnum = int(configur.get('rds', 'port_number'))
-    rds_username = configur.get('rds', 'user_name')
-    rds_pwd = configur.get('rds', 'user_pwd')
-    rds_dbname = configur.get('rds', 'db_name')
-
-    conn = datatier.get_dbConn(rds_endpoint, rds_portnum, rds_username, rds_pwd, rds_dbname)
 
     # structure for getting path parameters
     if "cardname" in event:
@@ -74,6 +45,9 @@ def lambda_handler(event, context):
             raise Exception("date is the only expected query parameter")
 
   
+    # input is valid, so now it's worth a database connection:
+    conn = bootstrap.get_dbConn()
+
     # example sql
     sql1 = f"SELECT * FROM cards WHERE cardname='{cardname}';"
     rows = datatier.retrieve_all_rows(conn, sql1)
@@ -81,7 +55,7 @@ def lambda_handler(event, context):
         raise Exception("This card's price is not being tracked")
     
     # example Scryfall query
-    url = "https://api.scryfall.com/cards/search?"
+    url = webservice.scryfall_url("/cards/search?")
 
     query = "Crag Saurian"
 
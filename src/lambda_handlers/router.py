@@ -0,0 +1,111 @@
+#
+# Python program to serve every MTG Price Tracker route from a single Lambda function
+#
+# Optional: instead of one Lambda function per route, deploy this
+# file together with all the other handlers (and src/helpers) as one
+# function, and point every API Gateway route (and the daily
+# EventBridge schedule) at router.lambda_handler. Requests are
+# dispatched in-process to the existing handlers, so all routes share
+# one warm container: its parsed config, database connection and
+# caches. A route's handler module is only imported the first time
+# that route is hit.
+#
+# Written by Jack Vogel using template code from Joe Hummel (Northwestern CS310)
+#
+
+import json
+import importlib
+import bootstrap
+
+
+#
+# (httpMethod, API Gateway resource) => handler module
+#
+ROUTES = {
+  ("GET", "/pricedrop/{numdays}"): "find_best_fetch",
+  ("GET", "/movers/{numdays}"): "get_movers",
+  ("PUT", "/newcards"): "update_tracking",
+  ("PUT", "/newcards/{query}"): "update_tracking",
+  ("GET", "/cards"): "get_cards",
+  ("GET", "/prices"): "get_prices",
+  ("POST", "/cardprices"): "get_card_prices",
+  ("GET", "/cardprice/{cardname}"): "get_card_price",
+  ("GET", "/history/{cardname}"): "get_price_history",
+  ("GET", "/analytics"): "get_analytics",
+}
+
+# The daily fetch only runs for events that explicitly ask for it,
+# so a stray test event (or an S3 / SQS one) can't start an ingest:
+# an EventBridge rule sends a "Scheduled Event", and an EventBridge
+# Scheduler schedule should send {"action": "fetch_prices"} as its
+# payload (plus e.g. "mode": "bulk", which fetch_prices reads as an
+# override):
+SCHEDULED = "fetch_prices"
+
+
+###################################################################
+#
+# route
+#
+def route(event):
+  """
+  Works out which handler module serves an event
+
+  Parameters
+  ----------
+  event: the lambda event (REST API proxy, HTTP API, or EventBridge
+    rule / Scheduler)
+
+  Returns
+  -------
+  (module name, None), or (None, error response) if no route matches
+  """
+  if event.get("detail-type") == "Scheduled Event" or event.get("action") == SCHEDULED:
+    return (SCHEDULED, None)
+
+  if "routeKey" in event:
+    # HTTP API (payload 2.0): "GET /cardprice/{cardname}"
+    method, _, resource = event["routeKey"].partition(" ")
+  else:
+    method = event.get("httpMethod")
+    resource = event.get("resource")
+
+  if method is None or resource is None:
+    return (None, {
+      'statusCode': 400,
+      'body': json.dumps("event has no httpMethod/resource to route on, and isn't a scheduled fetch")
+    })
+
+  name = ROUTES.get((method.upper(), resource))
+  if name is not None:
+    return (name, None)
+
+  allowed = sorted(m for (m, r) in ROUTES if r == resource)
+  if len(allowed) > 0:
+    return (None, {
+      'statusCode': 405,
+      'headers': {"Allow": ", ".join(allowed)},
+      'body': json.dumps(f"{method} is not supported on {resource}")
+    })
+
+  return (None, {
+    'statusCode': 404,
+    'body': json.dumps(f"no route for {method} {resource}")
+  })
+
+
+@bootstrap.cold_start_report
+def lambda_handler(event, context):
+  name, error = route(event)
+  if error is not None:
+    print("**ERROR**")
+    print(error["body"])
+    return error
+
+  print(f"**routing to {name}**")
+
+  # cached in sys.modules after the first import, so this is a dict
+  # lookup on warm invocations:
+  handler = importlib.import_module(name)
+
+  return handler.lambda_handler(event, context)
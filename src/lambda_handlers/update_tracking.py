@@ -6,57 +6,30 @@
 #
 
 import json
-import boto3
-import os
-import uuid
-import base64
-import pathlib
+import bootstrap
 import datatier
+import cardnames
+import querystats
 import webservice
-import urllib.parse
-import string
-import cryptography
 import datetime
 
-from configparser import ConfigParser
 
+@bootstrap.cold_start_report
+@querystats.instrumented
 def lambda_handler(event, context):
   try:
     print("**STARTING**")
     print("**adding cards to tracking...**")
     
     #
-    # setup AWS based on config file:
+    # config is parsed once per container (see bootstrap.py):
     #
-    config_file = 'mtgpricetracker.ini'
-    os.environ['AWS_SHARED_CREDENTIALS_FILE'] = config_file
-    
-    configur = ConfigParser()
-    configur.read(config_file)
-    
-    #
-    # configure for S3 access:
-    #
-    s3_profile = 's3readwrite'
-    boto3.setup_default_session(profile_name=s3_profile)
-    
-    bucketname = configur.get('s3', 'bucket_name')
-    
-    s3 = boto3.resource('s3')
-    bucket = s3.Bucket(bucketname)
-    
-    #
-    # configure for RDS access
-    #
-    rds_endpoint = configur.get('rds', 'endpoint')
-    rds_portnum = int(configur.get('rds', 'port_number'))
-    rds_username = configur.get('rds', 'user_name')
-    rds_pwd = configur.get('rds', 'user_pwd')
-    rds_dbname = configur.get('rds', 'db_name')
+    configur = bootstrap.config()
 
-    conn = datatier.get_dbConn(rds_endpoint, rds_portnum, rds_username, rds_pwd, rds_dbname)
+    # response cache, base url and rate limit from [scryfall]:
+    bootstrap.configure_scryfall()
   
-    url = "https://api.scryfall.com/cards/search?q=game%3Apaper+"
+    url = webservice.scryfall_url("/cards/search?q=game%3Apaper+")
 
     # expecting the request body  to have a query parameter
     if "body" in event:
@@ -75,67 +48,97 @@ def lambda_handler(event, context):
     new_query = query.replace(" ", "+")
 
     search = url + new_query
-    res = webservice.web_service_get(search)
-    body = json.loads(res.data)
 
-    # let's look at what we got back:
-    if res.status == 200: #success
-        pass
-    else:
-        # failed:
-        print("Failed with status code:", res.status)
-        if res.status >= 400:
-            # we'll have an error message
-            print("Error message:", body)
-        
-        #Scryfall error objects have a "code" and a "details" field:
-        if "code" in body and "details" in body:
-          code = body["code"]
-          print("Error code:", code)
-          details = body["details"]
-          print("Error details:", details)
-          raise Exception(f"Scryfall request returned error \"{code}\" and additional warnings: {details}")
-        else:
-          raise Exception(f"Scryfall request failed with status code {res.status}")
-
-      
+    # Scryfall returns up to 175 cards a page; follow next_page until
+    # the results run out or we hit the configured page cap
+    max_pages = configur.getint('tracking', 'max_pages', fallback=5)
+    if max_pages < 1:
+      raise Exception("[tracking] max_pages must be at least 1")
+
+    names = []
+    seen = set()
+    pages = 0
+    truncated = False
+
+    while search is not None:
+      res = webservice.web_service_get(search)
+      if res is None:
+        raise Exception("Scryfall request failed; see log for details")
+      body = json.loads(res.data)
+
+      # let's look at what we got back:
+      if res.status == 200: #success
+          pass
+      else:
+          # failed:
+          print("Failed with status code:", res.status)
+          if res.status >= 400:
+              # we'll have an error message
+              print("Error message:", body)
+          
+          #Scryfall error objects have a "code" and a "details" field:
+          if "code" in body and "details" in body:
+            code = body["code"]
+            print("Error code:", code)
+            details = body["details"]
+            print("Error details:", details)
+            raise Exception(f"Scryfall request returned error \"{code}\" and additional warnings: {details}")
+          else:
+            raise Exception(f"Scryfall request failed with status code {res.status}")
+
+      for row in body["data"]:
+        name = cardnames.normalize(row["name"])
+        if name not in seen:
+          seen.add(name)
+          names.append(name)
+
+      pages += 1
+      search = body.get("next_page") if body.get("has_more") else None
+      if search is not None and pages >= max_pages:
+        truncated = True
+        break
+
+    print(f"{len(names)} cards found in {pages} page(s) of search results")
+    if truncated:
+      print(f"Stopped after {max_pages} pages; raise [tracking] max_pages to add more")
+
     #otherwise we can get ready to add names to the tracking database
     today = datetime.date.today()
     if datetime.datetime.now().hour >= 9:
       today += datetime.timedelta(days=1) #cards have already been updated today
     today = today.strftime("%Y-%m-%d")
-    cutoff = 5
-    i = 0
-    numadded = 0
 
-    # deserialize and add name to database if it's not already there:
-    for row in body["data"]:
-      # don't want to add too many cards at a time
-      if i >= cutoff:
-        break
+    # only now, with a valid query and results in hand, connect:
+    conn = bootstrap.get_dbConn()
+
+    # one query for which of them are already tracked:
+    tracked = set()
+    if len(names) > 0:
+      sql = f"SELECT cardname FROM cards WHERE cardname IN ({', '.join(['%s'] * len(names))});"
+      rows = datatier.retrieve_all_rows(conn, sql, names)
+      tracked = {row[0] for row in rows}
 
-      name = row["name"].replace(" ", "+")
+    newnames = [name for name in names if name not in tracked]
+    for name in newnames:
       print(name)
 
-      sql = f"""SELECT * FROM cards WHERE cardname = '{name}';"""
-      rows = datatier.retrieve_all_rows(conn, sql)
-      if len(rows) == 0:
-        print("Card name not present; inserting...")
-        sql = f"""INSERT INTO cards(cardname, dateadded)
-                  values('{name}', '{today}');"""
-        num = datatier.perform_action(conn, sql)
-        if num != 1:
-          raise Exception(f"Failed to insert into database. Affected {num} rows.")
-        else:
-          print(f"Added {name} to the database.")
-          numadded += 1
-      i += 1
-
-    print(f"{numadded}/{i} cards from search were added to tracking!")
+    # and one multi-row insert, in a single transaction, for the rest
+    # (IGNORE in case another request added one of them meanwhile):
+    numadded = 0
+    if len(newnames) > 0:
+      sql = "INSERT IGNORE INTO cards(cardname, dateadded) VALUES (%s, %s);"
+      numadded = datatier.perform_bulk_action(conn, sql, [[name, today] for name in newnames],
+                                              batch_size=len(newnames))
+
+    print(f"{numadded}/{len(names)} cards from search were added to tracking!")
+
+    print("Scryfall cache:", webservice.get_cache_stats())
+    print("Scryfall connections:", webservice.get_pool_stats())
 
     return {
       'statusCode': 200,
-      'body': json.dumps(f"Done! Added {numadded} new cards to tracking!")
+      'body': json.dumps(f"Done! Added {numadded} new cards to tracking!"
+                         + (f" (only the first {max_pages} pages of results were checked)" if truncated else ""))
     }
   
   #
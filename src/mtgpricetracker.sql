@@ -2,6 +2,7 @@ CREATE DATABASE IF NOT EXISTS mtgpricetracker;
 
 USE mtgpricetracker;
 
+DROP TABLE IF EXISTS price_changes;
 DROP TABLE IF EXISTS prices;
 DROP TABLE IF EXISTS cards;
 
@@ -13,7 +14,8 @@ CREATE TABLE cards
     cardid       int not null AUTO_INCREMENT,
     cardname     varchar(256) not null,
     dateadded    date not null,
-    PRIMARY KEY  (cardid)
+    PRIMARY KEY  (cardid),
+    UNIQUE KEY   uq_cards_name (cardname)  -- handlers look cards up by name, update_tracking INSERT IGNOREs on this
 );
 
 ALTER TABLE cards AUTO_INCREMENT = 10001;  -- starting value
@@ -30,12 +32,51 @@ CREATE TABLE prices
     cardname     varchar(256) not null,
     pricedate    date not null,
     imagekey     varchar(256) not null,
-    PRIMARY KEY  (priceid)
+    PRIMARY KEY  (priceid),
+    UNIQUE KEY   uq_prices_card_date (cardname, pricedate),  -- one price per card per day, fetch_prices upserts on this
+    KEY          ix_prices_date (pricedate),                 -- find_best_fetch looks up whole days at a time
+    KEY          ix_prices_set (setcode)                     -- /prices?set= (InnoDB appends priceid, so pages stay in key order)
 );
 
+-- to add the key to an existing prices table, first delete any duplicate
+-- (cardname, pricedate) rows, keeping the most recently inserted one:
+--
+--   DELETE p1 FROM prices p1
+--     JOIN prices p2 ON p1.cardname = p2.cardname AND p1.pricedate = p2.pricedate AND p1.priceid < p2.priceid;
+--   ALTER TABLE prices ADD UNIQUE KEY uq_prices_card_date (cardname, pricedate);
+--   ALTER TABLE prices ADD KEY ix_prices_date (pricedate);
+--   ALTER TABLE prices ADD KEY ix_prices_set (setcode);
+--
+-- and to add the cards key, delete any duplicate names, keeping the
+-- first one added:
+--
+--   DELETE c1 FROM cards c1
+--     JOIN cards c2 ON c1.cardname = c2.cardname AND c1.cardid > c2.cardid;
+--   ALTER TABLE cards ADD UNIQUE KEY uq_cards_name (cardname);
+
 
 ALTER TABLE prices AUTO_INCREMENT = 1001;  -- starting value
 
+-- this table holds each card's price change over the standard windows (1, 7, 30, 90
+-- and 365 days) as of the latest ingest, so /pricedrop for those windows is an index
+-- lookup. fetch_prices refreshes it (see src/helpers/pricechanges.py) after every run;
+-- prevprice / diff are null when the card has no price windowdays before asofdate
+
+CREATE TABLE price_changes
+(
+    cardname     varchar(256) not null,
+    windowdays   int not null,
+    asofdate     date not null,
+    price        float not null,
+    setcode      varchar(8) not null,
+    prevprice    float,
+    diff         float,
+    minprice     float not null,  -- lowest price within the window
+    maxprice     float not null,  -- highest price within the window
+    PRIMARY KEY  (cardname, windowdays),
+    KEY          ix_price_changes_window (windowdays, asofdate, diff)
+);
+
 
 --
 -- This is creating user accounts for database access. You can change the details
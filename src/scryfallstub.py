@@ -0,0 +1,357 @@
+#
+# Local stand-in for the parts of the Scryfall API that
+# mtgpricetracker uses, for load and regression testing the ingest
+# path (fetch_prices, update_tracking) without hitting the real API.
+#
+# Serves:
+#   GET /cards/search?q=...&unique=cards|prints&page=N
+#       paginated list objects (has_more / next_page), or a
+#       not_found / bad_request error object
+#   GET /bulk-data
+#       a bulk-data list whose default_cards download_uri points back
+#       at this server
+#   GET /bulk-data/default_cards.json
+#       every card, as one JSON array
+#
+# Only the search syntax mtgpricetracker sends is understood: !"name"
+# or !'name' (exact name), name words, game:, set: (s:, e:), t:
+# (type:), is:memorabilia, include:extras (ignored) and - to negate a
+# term. Unknown terms are ignored with a warning, like Scryfall does.
+#
+# Cards come from fixture files (JSON arrays of Scryfall card
+# objects; src/tests/scryfall has a small set) and/or --synthetic N,
+# which generates cards named "Card 00000", "Card 00001", ... with a
+# few printings each, matching the names sqlitebackend.py's
+# synthetic data tracks.
+#
+# Usage:
+#   python scryfallstub.py [--port 8080] [--fixtures file.json ...]
+#     [--synthetic N] [--latency ms] [--jitter ms] [--rate-limit r]
+#     [--error-rate p] [--page-size n] [--seed s]
+#
+# then set base_url = http://localhost:8080 (and a higher
+# rate_limit) in the [scryfall] section of the config file.
+#
+# --rate-limit answers requests beyond r per second with 429 and a
+# Retry-After header, as Scryfall does; --error-rate answers that
+# fraction of requests with a random 429 or 503 to exercise retries.
+#
+# Authors:
+#   Jack Vogel
+#
+
+import argparse
+import json
+import pathlib
+import random
+import re
+import sys
+import threading
+import time
+import urllib.parse
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+DEFAULT_FIXTURES = pathlib.Path(__file__).parent / "tests" / "scryfall" / "cards.json"
+
+
+############################################################
+#
+# loading cards
+#
+def load_fixtures(paths):
+  cards = []
+  for path in paths:
+    with open(path, "r", encoding="utf-8") as f:
+      cards.extend(json.load(f))
+  return cards
+
+
+def synthetic_cards(n, seed=0):
+  rng = random.Random(seed)
+  cards = []
+  for i in range(n):
+    for j in range(rng.randint(1, 4)):
+      usd = None if rng.random() < 0.1 else f"{rng.uniform(0.25, 150.0):.2f}"
+      cards.append({
+        "object": "card",
+        "name": f"Card {i:05d}",
+        "set": f"s{(i + j) % 40:02d}",
+        "set_type": "expansion",
+        "type_line": "Land",
+        "games": ["paper", "mtgo"] if j > 0 else ["paper"],
+        "prices": {"usd": usd, "usd_foil": None, "eur": None, "tix": None}
+      })
+  return cards
+
+
+############################################################
+#
+# search
+#
+_re_term = re.compile(r"""-?!"[^"]*"|-?!'[^']*'|-?!\S+|-?\w+:"[^"]*"|-?\w+:'[^']*'|-?\S+""")
+
+
+def _unquote(value):
+  if len(value) >= 2 and value[0] == value[-1] and value[0] in "\"'":
+    return value[1:-1]
+  return value
+
+
+def parse_query(q):
+  """
+  Returns (list of (negated, predicate) filters, list of warnings)
+  """
+  filters = []
+  warnings = []
+
+  for term in _re_term.findall(q):
+    negated = term.startswith("-")
+    if negated:
+      term = term[1:]
+
+    if term.startswith("!"):
+      name = _unquote(term[1:]).lower()
+      filters.append((negated, lambda c, name=name: c["name"].lower() == name))
+      continue
+
+    key, sep, value = term.partition(":")
+    if sep == "":
+      word = _unquote(term).lower()
+      filters.append((negated, lambda c, word=word: word in c["name"].lower()))
+      continue
+
+    key = key.lower()
+    value = _unquote(value).lower()
+
+    if key == "game":
+      filters.append((negated, lambda c, v=value: v in c.get("games", [])))
+    elif key in ("set", "s", "e"):
+      filters.append((negated, lambda c, v=value: c.get("set", "").lower() == v))
+    elif key in ("t", "type"):
+      filters.append((negated, lambda c, v=value: v in c.get("type_line", "").lower()))
+    elif key == "name":
+      filters.append((negated, lambda c, v=value: v in c["name"].lower()))
+    elif key == "is" and value == "memorabilia":
+      filters.append((negated, lambda c: c.get("set_type") == "memorabilia"))
+    elif key == "include":
+      pass  # every fixture card is already "included"
+    else:
+      warnings.append(f"Invalid expression \"{term}\" was ignored.")
+
+  return (filters, warnings)
+
+
+def search(cards, q, unique):
+  filters, warnings = parse_query(q)
+
+  found = []
+  names = set()
+  for card in cards:
+    if all(pred(card) != negated for negated, pred in filters):
+      if unique != "prints":
+        if card["name"] in names:
+          continue
+        names.add(card["name"])
+      found.append(card)
+
+  found.sort(key=lambda c: (c["name"], c.get("set", "")))
+  return (found, warnings)
+
+
+############################################################
+#
+# the server
+#
+class Stub:
+
+  def __init__(self, cards, latency=0.0, jitter=0.0, rate_limit=None,
+               error_rate=0.0, page_size=175, seed=0):
+    self.cards = cards
+    self.latency = latency
+    self.jitter = jitter
+    self.rate_limit = rate_limit
+    self.error_rate = error_rate
+    self.page_size = page_size
+    self.rng = random.Random(seed)
+    self.lock = threading.Lock()
+    self.tokens = 1.0
+    self.last = time.monotonic()
+    self.stats = {"requests": 0, "rate_limited": 0, "injected_errors": 0}
+
+  def admit(self):
+    """
+    Returns None to serve the request, or (status, retry_after) to
+    refuse it
+    """
+    with self.lock:
+      self.stats["requests"] += 1
+
+      if self.error_rate > 0 and self.rng.random() < self.error_rate:
+        self.stats["injected_errors"] += 1
+        return self.rng.choice([(429, 1), (503, None)])
+
+      if self.rate_limit is not None:
+        now = time.monotonic()
+        self.tokens = min(1.0, self.tokens + (now - self.last) * self.rate_limit)
+        self.last = now
+        if self.tokens < 1.0:
+          self.stats["rate_limited"] += 1
+          return (429, 1)
+        self.tokens -= 1.0
+
+    return None
+
+  def delay(self):
+    with self.lock:
+      seconds = self.latency + (self.rng.uniform(0, self.jitter) if self.jitter > 0 else 0.0)
+    if seconds > 0:
+      time.sleep(seconds)
+
+
+def error_object(status, code, details, warnings=None):
+  body = {"object": "error", "code": code, "status": status, "details": details}
+  if warnings:
+    body["warnings"] = warnings
+  return body
+
+
+def make_handler(stub):
+
+  class Handler(BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real API
+
+    def log_message(self, format, *args):
+      pass  # one line per request drowns out everything else
+
+    def send_json(self, status, body, headers={}):
+      data = json.dumps(body).encode("utf-8")
+      self.send_response(status)
+      self.send_header("Content-Type", "application/json; charset=utf-8")
+      self.send_header("Content-Length", str(len(data)))
+      for name, value in headers.items():
+        self.send_header(name, value)
+      self.end_headers()
+      self.wfile.write(data)
+
+    def base_url(self):
+      return f"http://{self.headers.get('Host', '%s:%d' % self.server.server_address)}"
+
+    def do_GET(self):
+      stub.delay()
+
+      refused = stub.admit()
+      if refused is not None:
+        status, retry_after = refused
+        if status == 429:
+          self.send_json(429, error_object(429, "too_many_requests", "You are sending requests too quickly."),
+                         {"Retry-After": str(retry_after)})
+        else:
+          self.send_json(status, error_object(status, "service_unavailable", "Try again later."))
+        return
+
+      url = urllib.parse.urlsplit(self.path)
+      params = urllib.parse.parse_qs(url.query)
+
+      if url.path == "/cards/search":
+        self.cards_search(params)
+      elif url.path == "/bulk-data":
+        self.send_json(200, {
+          "object": "list",
+          "has_more": False,
+          "data": [{
+            "object": "bulk_data",
+            "type": "default_cards",
+            "download_uri": self.base_url() + "/bulk-data/default_cards.json",
+            "content_type": "application/json",
+            "content_encoding": "gzip"
+          }]
+        })
+      elif url.path == "/bulk-data/default_cards.json":
+        self.send_json(200, stub.cards)
+      else:
+        self.send_json(404, error_object(404, "not_found", f"No endpoint at {url.path}."))
+
+    def cards_search(self, params):
+      q = params.get("q", [""])[0]
+      if q.strip() == "":
+        self.send_json(400, error_object(400, "bad_request", "You didn't provide a search query."))
+        return
+
+      try:
+        page = int(params.get("page", ["1"])[0])
+        if page < 1:
+          raise ValueError()
+      except ValueError:
+        self.send_json(400, error_object(400, "bad_request", "page must be a positive integer."))
+        return
+
+      unique = params.get("unique", ["cards"])[0]
+      found, warnings = search(stub.cards, q, unique)
+
+      if len(found) == 0:
+        self.send_json(404, error_object(404, "not_found", "Your query didn't match any cards. Adjust your search terms or refer to the syntax guide at https://scryfall.com/docs/reference", warnings))
+        return
+
+      first = (page - 1) * stub.page_size
+      if first >= len(found):
+        self.send_json(422, error_object(422, "bad_request", "You have paginated beyond the end of these results."))
+        return
+
+      body = {
+        "object": "list",
+        "total_cards": len(found),
+        "has_more": first + stub.page_size < len(found),
+        "data": found[first:first + stub.page_size]
+      }
+      if body["has_more"]:
+        query = {"q": q, "unique": unique, "page": page + 1}
+        body["next_page"] = self.base_url() + "/cards/search?" + urllib.parse.urlencode(query)
+      if warnings:
+        body["warnings"] = warnings
+
+      self.send_json(200, body)
+
+  return Handler
+
+
+def main(argv):
+  parser = argparse.ArgumentParser(description="Local stand-in for the Scryfall API")
+  parser.add_argument("--port", type=int, default=8080)
+  parser.add_argument("--fixtures", nargs="*", default=None,
+                      help=f"JSON arrays of card objects (default {DEFAULT_FIXTURES})")
+  parser.add_argument("--synthetic", type=int, default=0, help="# of generated cards to add")
+  parser.add_argument("--latency", type=float, default=0.0, help="ms added to every response")
+  parser.add_argument("--jitter", type=float, default=0.0, help="up to this many more random ms")
+  parser.add_argument("--rate-limit", type=float, default=None, help="requests/second before 429s")
+  parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests failed with 429 / 503")
+  parser.add_argument("--page-size", type=int, default=175)
+  parser.add_argument("--seed", type=int, default=0)
+  args = parser.parse_args(argv)
+
+  fixtures = args.fixtures
+  if fixtures is None:
+    fixtures = [] if args.synthetic > 0 else [DEFAULT_FIXTURES]
+
+  cards = load_fixtures(fixtures) + synthetic_cards(args.synthetic, args.seed)
+
+  stub = Stub(cards, latency=args.latency / 1000.0, jitter=args.jitter / 1000.0,
+              rate_limit=args.rate_limit, error_rate=args.error_rate,
+              page_size=args.page_size, seed=args.seed)
+
+  server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(stub))
+  print(f"** serving {len(cards)} cards on http://127.0.0.1:{args.port} (ctrl-c to stop) **")
+
+  try:
+    server.serve_forever()
+  except KeyboardInterrupt:
+    pass
+  finally:
+    server.server_close()
+    print("**", stub.stats, "**")
+
+
+if __name__ == "__main__":
+  main(sys.argv[1:])